@@ -0,0 +1,252 @@
+import os
+import queue
+import warnings
+import multiprocessing as mp
+
+from stable_baselines3.common.callbacks import BaseCallback
+
+
+def _gif_worker(requests, env_class, env_kwargs, policy_class, policy_kwargs,
+                observation_space, action_space, max_frames, fps, save_replay):
+    """
+    录制进程：模拟器只启动一次，之后每次录制只 reset；
+    每个请求带一份策略权重快照，录完写出 GIF，全程不占用训练进程。
+    save_replay=True 时同时在 GIF 旁边写一份回放文件（存档 + 动作序列）。
+    """
+    import imageio
+    import torch
+    from envs.replay import Replay
+
+    torch.set_num_threads(1)
+    eval_env = env_class(**env_kwargs)
+    eval_env.render_screen = True  # obs_mode="ram" 的环境默认不渲染，录制时需要画面
+    policy = policy_class(observation_space, action_space, lambda _: 0.0, **policy_kwargs)
+    policy.set_training_mode(False)
+    try:
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            gif_path, state_dict = request
+            policy.load_state_dict(state_dict)
+
+            frames = []
+            actions = []
+            try:
+                obs, _ = eval_env.reset()
+                for _ in range(max_frames):
+                    frames.append(eval_env.pyboy.screen.ndarray.copy())
+                    action, _ = policy.predict(obs, deterministic=True)
+                    actions.append(int(action))
+                    obs, _, done, truncated, _ = eval_env.step(int(action))
+                    if done or truncated:
+                        break
+            except Exception as e:
+                print(f"Error during GIF recording: {e}")
+
+            if save_replay and len(actions) > 0:
+                Replay.from_env(eval_env, actions).save(os.path.splitext(gif_path)[0] + ".npz")
+
+            if len(frames) > 0:
+                imageio.mimsave(gif_path, frames, fps=fps)
+            else:
+                print("Warning: No frames were captured.")
+    finally:
+        eval_env.close()
+
+
+class AsyncSaveGifCallback(BaseCallback):
+    def __init__(self, env_class, env_kwargs, save_path, save_interval, max_frames=1000, fps=30,
+                 save_replay=True, verbose=0):
+        """
+        每隔 save_interval 步把策略权重快照交给后台录制进程，训练线程不等待录制完成。
+
+        :param env_class: 环境的类对象 (例如 Zelda_Env)，需要能被子进程导入
+        :param env_kwargs: 初始化环境需要的参数字典
+        :param save_path: GIF 保存路径
+        :param save_interval: 保存间隔
+        :param max_frames: 限制录制的最大帧数，防止无限循环
+        :param fps: GIF 帧率
+        :param save_replay: 是否同时保存回放文件（见 envs/replay.py）
+        """
+        super().__init__(verbose)
+        self.env_class = env_class
+        self.env_kwargs = env_kwargs
+        self.save_path = save_path
+        self.save_interval = save_interval
+        self.max_frames = max_frames
+        self.fps = fps
+        self.save_replay = save_replay
+        self.next_save = save_interval
+        self.requests = None
+        self.process = None
+        self.warned_dead = False
+        os.makedirs(self.save_path, exist_ok=True)
+
+    def _on_training_start(self) -> None:
+        # 续训时从当前步数之后的下一个录制点开始
+        self.next_save = (self.num_timesteps // self.save_interval + 1) * self.save_interval
+        # spawn：训练进程里已经初始化了 torch 线程池，fork 出来的子进程可能死锁
+        ctx = mp.get_context("spawn")
+        # 只保留一个待处理请求，录制进程忙时跳过本次录制而不是堆积
+        self.requests = ctx.Queue(maxsize=1)
+        self.process = ctx.Process(
+            target=_gif_worker,
+            args=(
+                self.requests,
+                self.env_class,
+                self.env_kwargs,
+                self.model.policy_class,
+                self.model.policy_kwargs,
+                self.model.observation_space,
+                self.model.action_space,
+                self.max_frames,
+                self.fps,
+                self.save_replay,
+            ),
+            daemon=True,
+        )
+        self.process.start()
+
+    def _on_step(self) -> bool:
+        if self.num_timesteps >= self.next_save:
+            self.next_save += self.save_interval
+            if not self.process.is_alive():
+                if not self.warned_dead:
+                    warnings.warn(f"GIF recorder process exited (code {self.process.exitcode}); no more GIFs will be saved")
+                    self.warned_dead = True
+                return True
+            # 录制进程忙时直接跳过，不白白拷贝一份权重
+            if self.requests.full():
+                if self.verbose > 0:
+                    print(f"Recorder busy, skipping GIF at step {self.num_timesteps}")
+                return True
+            gif_path = os.path.join(self.save_path, f"step_{self.num_timesteps}.gif")
+            state_dict = {k: v.detach().cpu().clone() for k, v in self.model.policy.state_dict().items()}
+            try:
+                self.requests.put_nowait((gif_path, state_dict))
+                if self.verbose > 0:
+                    print(f"Queued GIF recording to {gif_path}")
+            except queue.Full:
+                if self.verbose > 0:
+                    print(f"Recorder busy, skipping GIF at step {self.num_timesteps}")
+        return True
+
+    def _on_training_end(self) -> None:
+        if self.process is None:
+            return
+        # 等待已排队的录制写完再退出（录制进程已经退出时队列可能是满的，不能再 put）
+        if self.process.is_alive():
+            self.requests.put(None)
+        self.process.join()
+        self.process = None
+
+
+class StepTimingCallback(BaseCallback):
+    """
+    每个 rollout 结束时汇总所有环境的分阶段计时，写入 TensorBoard 的 timing/ 分组。
+    需要环境以 BaseEnv(profile=True) 创建，否则不记录任何内容。
+    """
+    def _on_step(self) -> bool:
+        return True
+
+    def _on_rollout_end(self) -> None:
+        from envs.profiling import PHASES, merge_timing_stats
+
+        stats = merge_timing_stats(self.training_env.env_method("get_timing_stats", window=True))
+        steps = stats["steps"]
+        if steps == 0:
+            return
+        busy = sum(stats[phase] for phase in PHASES)
+        for phase in PHASES:
+            self.logger.record(f"timing/{phase}_ms_per_step", stats[phase] / steps * 1e3)
+        self.logger.record("timing/frames_per_step", stats["frames"] / steps)
+        if busy > 0:
+            self.logger.record("timing/emulate_fraction", stats["emulate"] / busy)
+
+
+class TaskStatsCallback(BaseCallback):
+    """
+    多任务训练（envs/multi_task.py）时，每个 rollout 结束后汇总各任务的回合统计，
+    写入 TensorBoard 的 tasks/<任务名>/ 分组；reweight 不为空时用它调整任务混合权重。
+
+    :param reweight: 函数 (stats, num_timesteps) -> 权重（序列或 {任务名: 权重}），返回 None 表示不调整，
+        例如 lambda stats, _: success_weights(stats)
+    """
+    def __init__(self, reweight=None, verbose=0):
+        super().__init__(verbose)
+        self.reweight = reweight
+
+    def _on_step(self) -> bool:
+        return True
+
+    def _on_rollout_end(self) -> None:
+        from envs.multi_task import merge_task_stats
+
+        stats = merge_task_stats(self.training_env.env_method("pop_task_stats"))
+        for name, task_stats in stats.items():
+            episodes = task_stats["episodes"]
+            self.logger.record(f"tasks/{name}/episodes", episodes)
+            if episodes == 0:
+                continue
+            self.logger.record(f"tasks/{name}/ep_rew_mean", task_stats["reward"] / episodes)
+            self.logger.record(f"tasks/{name}/ep_len_mean", task_stats["length"] / episodes)
+            self.logger.record(f"tasks/{name}/success_rate", task_stats["goals"] / episodes)
+
+        if self.reweight is None:
+            return
+        weights = self.reweight(stats, self.num_timesteps)
+        if weights is None:
+            return
+        self.training_env.env_method("set_task_weights", weights)
+        for name, weight in (weights.items() if isinstance(weights, dict) else zip(stats, weights)):
+            self.logger.record(f"tasks/{name}/weight", weight)
+        if self.verbose > 0:
+            print(f"Task weights set to {weights}")
+
+
+class AsyncCheckpointCallback(BaseCallback):
+    """
+    每隔 save_interval 步保存一次完整训练检查点（见 PPO/checkpoint.py），在 rollout 开始时截取，
+    写盘在后台线程里进行，训练不等待磁盘。用 train.py --resume 从最新的检查点继续。
+
+    :param save_path: 检查点目录，文件名为 checkpoint_<步数>.pt
+    :param save_interval: 保存间隔（环境步数）
+    :param keep: 保留最近的检查点个数
+    :param visit_counts: 全局格子访问计数（envs/visit_map.py 的 VisitCounts），一起存进检查点
+    """
+    def __init__(self, save_path, save_interval, keep=3, visit_counts=None, verbose=0):
+        super().__init__(verbose)
+        self.save_path = save_path
+        self.save_interval = save_interval
+        self.keep = keep
+        self.visit_counts = visit_counts
+        self.next_save = save_interval
+        self.writer = None
+        os.makedirs(self.save_path, exist_ok=True)
+
+    def _on_training_start(self) -> None:
+        from PPO.checkpoint import CheckpointWriter
+
+        # 续训时从当前步数之后的下一个整点开始
+        self.next_save = (self.num_timesteps // self.save_interval + 1) * self.save_interval
+        self.writer = CheckpointWriter(self.save_path, keep=self.keep)
+
+    def _on_step(self) -> bool:
+        return True
+
+    def _on_rollout_start(self) -> None:
+        from PPO.checkpoint import checkpoint_state
+
+        if self.num_timesteps < self.next_save:
+            return
+        self.next_save = (self.num_timesteps // self.save_interval + 1) * self.save_interval
+        self.writer.submit(checkpoint_state(self.model, self.visit_counts))
+        if self.verbose > 0:
+            print(f"Queued checkpoint at step {self.num_timesteps}")
+
+    def _on_training_end(self) -> None:
+        if self.writer is None:
+            return
+        self.writer.close()
+        self.writer = None
@@ -0,0 +1,150 @@
+from __future__ import annotations
+import glob
+import os
+import queue
+import random
+import re
+import threading
+from collections import deque
+
+import numpy as np
+import torch
+
+# 完整训练检查点：策略 + 优化器 + EWMA 回报统计 + 计数器 + 随机数状态 + 每个环境的快照。
+# 在 rollout 开始时（上一次 train 之后）截取，此时训练状态是一致的；
+# 截取只做内存拷贝，序列化和写盘在后台线程里完成。
+
+_CHECKPOINT_RE = re.compile(r"checkpoint_(\d+)\.pt$")
+
+
+def _cpu_clone(value):
+    """把（嵌套的）张量拷到 CPU，后台线程写盘时训练可以继续原地更新参数"""
+    if isinstance(value, torch.Tensor):
+        return value.detach().to("cpu", copy=True)
+    if isinstance(value, dict):
+        return {key: _cpu_clone(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_cpu_clone(item) for item in value)
+    return value
+
+
+def checkpoint_state(model, visit_counts=None) -> dict:
+    """截取 CustomPPO 的完整训练状态（在训练线程里调用，只做内存拷贝），visit_counts 为全局格子访问计数"""
+    buffer = model.rollout_buffer
+    return {
+        "policy": _cpu_clone(model.policy.state_dict()),
+        "optimizer": _cpu_clone(model.policy.optimizer.state_dict()),
+        "ewma": {"mean": buffer.ewma_mean, "var": buffer.ewma_var, "count": buffer.ewma_count},
+        "num_timesteps": model.num_timesteps,
+        "n_updates": model._n_updates,
+        "episode_num": model._episode_num,
+        "last_obs": np.array(model._last_obs),
+        "last_episode_starts": np.array(model._last_episode_starts),
+        "ep_info_buffer": list(model.ep_info_buffer),
+        "ep_success_buffer": list(model.ep_success_buffer),
+        "rng": {
+            "torch": torch.get_rng_state(),
+            "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+            "numpy": np.random.get_state(),
+            "random": random.getstate(),
+        },
+        # 各 worker 的环境快照（模拟器存档 + 进行中的回合状态），见 BaseEnv.snapshot
+        "env_snapshots": model.env.env_method("snapshot"),
+        "visit_counts": visit_counts.counts.copy() if visit_counts is not None else None,
+    }
+
+
+def write_checkpoint(state: dict, path: str):
+    """先写临时文件再原子替换，被中断时不会留下半个检查点"""
+    tmp_path = path + ".tmp"
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def list_checkpoints(save_path: str) -> list[str]:
+    """按步数从小到大列出目录里的检查点"""
+    paths = [path for path in glob.glob(os.path.join(save_path, "checkpoint_*.pt")) if _CHECKPOINT_RE.search(path)]
+    return sorted(paths, key=lambda path: int(_CHECKPOINT_RE.search(path).group(1)))
+
+
+def latest_checkpoint(path: str) -> str | None:
+    """path 为检查点文件时原样返回，为目录时返回其中步数最大的检查点"""
+    if os.path.isfile(path):
+        return path
+    checkpoints = list_checkpoints(path)
+    return checkpoints[-1] if checkpoints else None
+
+
+def load_checkpoint(model, path: str, visit_counts=None) -> dict:
+    """
+    把检查点恢复进一个用相同配置新建的 CustomPPO（环境已创建），之后以
+    model.learn(total_timesteps=剩余步数, reset_num_timesteps=False) 继续训练
+    """
+    state = torch.load(path, map_location=model.device, weights_only=False)
+    model.policy.load_state_dict(state["policy"])
+    model.policy.optimizer.load_state_dict(state["optimizer"])
+    buffer = model.rollout_buffer
+    buffer.ewma_mean = state["ewma"]["mean"]
+    buffer.ewma_var = state["ewma"]["var"]
+    buffer.ewma_count = state["ewma"]["count"]
+    model.num_timesteps = state["num_timesteps"]
+    model._n_updates = state["n_updates"]
+    model._episode_num = state["episode_num"]
+    model.ep_info_buffer = deque(state["ep_info_buffer"], maxlen=model._stats_window_size)
+    model.ep_success_buffer = deque(state["ep_success_buffer"], maxlen=model._stats_window_size)
+
+    if visit_counts is not None and state.get("visit_counts") is not None:
+        visit_counts.counts[:] = state["visit_counts"]
+    # 用快照复位每个环境：回合从检查点处继续，而不是重新开始
+    model.env.set_options([{"snapshot": snapshot} for snapshot in state["env_snapshots"]])
+    model.env.reset()
+    model._last_obs = state["last_obs"]
+    model._last_episode_starts = state["last_episode_starts"]
+
+    rng = state["rng"]
+    torch.set_rng_state(rng["torch"])
+    if rng["cuda"] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(rng["cuda"])
+    np.random.set_state(rng["numpy"])
+    random.setstate(rng["random"])
+    return state
+
+
+class CheckpointWriter:
+    """后台写盘线程：只保留一个待写的检查点，写盘跟不上时新的检查点替换掉还没开始写的旧检查点"""
+    def __init__(self, save_path: str, keep: int = 3):
+        self.save_path = save_path
+        self.keep = keep
+        self.requests = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, state: dict):
+        while True:
+            try:
+                self.requests.put_nowait(state)
+                return
+            except queue.Full:
+                try:
+                    self.requests.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _run(self):
+        while True:
+            state = self.requests.get()
+            if state is None:
+                break
+            path = os.path.join(self.save_path, f"checkpoint_{state['num_timesteps']}.pt")
+            try:
+                write_checkpoint(state, path)
+            except Exception as e:
+                print(f"Error writing checkpoint {path}: {e}")
+                continue
+            for old_path in list_checkpoints(self.save_path)[:-self.keep]:
+                os.remove(old_path)
+
+    def close(self):
+        """等待已提交的检查点写完"""
+        self.requests.put(None)
+        self.thread.join()
@@ -7,9 +7,11 @@ from stable_baselines3.common.policies import ActorCriticPolicy
 from stable_baselines3.common.callbacks import BaseCallback
 import numpy as np
 from stable_baselines3.common.buffers import RolloutBuffer
+from stable_baselines3.common.type_aliases import RolloutBufferSamples
 from tqdm import tqdm
 from stable_baselines3 import PPO
-from stable_baselines3.common.utils import explained_variance
+from stable_baselines3.common.utils import explained_variance, obs_as_tensor
+from stable_baselines3.common.vec_env import VecEnvWrapper
 from gymnasium import spaces
 
 from gymnasium.spaces import Box, Dict
@@ -29,28 +31,44 @@ class ResNetBlock(nn.Module):
         return x + residual
     
 
+def _image_shape(observation_space: gym.Space):
+    """从观测空间解析出 (c, h, w)"""
+    # 取出真实的图像空间
+    if isinstance(observation_space, Dict):
+        image_space = observation_space["game_area"]
+        shape = image_space.shape
+    elif isinstance(observation_space, spaces.Box):
+        shape = observation_space.shape
+    else:
+        raise ValueError(f"Unsupported observation space type: {type(observation_space)}")
+
+    if len(shape) == 3:
+        if shape[2] in (1, 3, 4) and shape[0] not in (1, 3, 4): # HWC
+            h, w, c = shape
+        else:                       # CHW（包括 frame_stack 叠帧后的 (k, 8, 10)）
+            c, h, w = shape
+    else:
+        c = 1
+        h, w = shape
+    return c, h, w
+
+
+def _to_nchw(observations: torch.Tensor, in_channels: int) -> torch.Tensor:
+    # SB3 在使用 VecTransposeImage 后会把输入变为 CHW。
+    # 若仍是 HWC，则仅在需要时转为 CHW。
+    if observations.dim() == 4 and observations.shape[1] != in_channels and observations.shape[-1] == in_channels:
+        observations = observations.permute(0, 3, 1, 2).contiguous()
+
+    if observations.dim() == 3:
+        observations = observations.unsqueeze(1)
+    return observations
+
+
 class CustomResNet(BaseFeaturesExtractor):
     def __init__(self, observation_space: gym.Space, features_dim: int = 1024):
         super().__init__(observation_space, features_dim)
 
-        # 取出真实的图像空间
-        if isinstance(observation_space, Dict):
-            image_space = observation_space["game_area"]
-            shape = image_space.shape
-        elif isinstance(observation_space, spaces.Box):
-            shape = observation_space.shape
-        else:
-            raise ValueError(f"Unsupported observation space type: {type(observation_space)}")
-
-        if len(shape) == 3:
-            if shape[0] in (1, 3, 4):   # CHW
-                c, h, w = shape
-            elif shape[2] in (1, 3, 4): # HWC
-                h, w, c = shape
-        else:
-            c = 1
-            h, w = shape
-
+        c, h, w = _image_shape(observation_space)
         self.in_channels = c
 
         self.conv_net = nn.Sequential(
@@ -93,18 +111,66 @@ class CustomResNet(BaseFeaturesExtractor):
                     nn.init.constant_(m.bias, 0)
 
     def forward(self, observations: torch.Tensor) -> torch.Tensor:
-        # SB3 在使用 VecTransposeImage 后会把输入变为 CHW。
-        # 若仍是 HWC，则仅在需要时转为 CHW。
-        if observations.dim() == 4 and observations.shape[1] != self.in_channels and observations.shape[-1] == self.in_channels:
-            observations = observations.permute(0, 3, 1, 2).contiguous()
+        features = self.conv_net(_to_nchw(observations, self.in_channels))
+        return self.dense_net(features)
+
+
+class CompactCNN(BaseFeaturesExtractor):
+    """
+    面向 8x10 这类小输入的轻量特征提取器，按观测尺寸决定下采样次数：
+    每个 stage 为 conv3x3 + ReLU（可选 blocks 个 ResNetBlock），
+    只有在下采样后边长仍不小于 min_size 时才池化，避免把特征图压到 1x2。
+
+    :param widths: 每个 stage 的通道数，长度即深度
+    :param blocks: 每个 stage 追加的 ResNetBlock 数量
+    :param pool: "max" / "avg" / "none"
+    :param min_size: 池化后特征图的最小边长
+    """
+    def __init__(self, observation_space: gym.Space, features_dim: int = 256, widths=(32, 64),
+                 blocks: int = 0, pool: str = "max", min_size: int = 2):
+        super().__init__(observation_space, features_dim)
+        if pool not in ("max", "avg", "none"):
+            raise ValueError(f"Unknown pool: {pool}")
 
-        if observations.dim() == 3:
-            observations = observations.unsqueeze(1)
+        c, h, w = _image_shape(observation_space)
+        self.in_channels = c
+
+        layers = []
+        in_ch = c
+        for width in widths:
+            layers += [nn.Conv2d(in_ch, width, 3, stride=1, padding=1), nn.ReLU()]
+            layers += [ResNetBlock(width) for _ in range(blocks)]
+            if pool != "none" and min(h, w) // 2 >= min_size:
+                layers.append(nn.MaxPool2d(2) if pool == "max" else nn.AvgPool2d(2))
+                h, w = h // 2, w // 2
+            in_ch = width
+        self.conv_net = nn.Sequential(*layers)
+
+        self.dense_net = nn.Sequential(
+            nn.Flatten(),
+            nn.Linear(in_ch * h * w, features_dim),
+            nn.ReLU()
+        )
+
+        for m in self.modules():
+            if isinstance(m, (nn.Conv2d, nn.Linear)):
+                nn.init.kaiming_normal_(m.weight, mode='fan_in', nonlinearity='relu')
+                if m.bias is not None:
+                    nn.init.constant_(m.bias, 0)
 
-        features = self.conv_net(observations)
+    def forward(self, observations: torch.Tensor) -> torch.Tensor:
+        features = self.conv_net(_to_nchw(observations, self.in_channels))
         return self.dense_net(features)
 
 
+# 预设的 CompactCNN 规格，用法：features_extractor_kwargs=COMPACT_CNN_PRESETS["small"]
+COMPACT_CNN_PRESETS = {
+    "tiny":   {"features_dim": 128, "widths": (16, 32)},
+    "small":  {"features_dim": 256, "widths": (32, 64)},
+    "medium": {"features_dim": 512, "widths": (32, 64, 64), "blocks": 1},
+}
+
+
 class CustomACPolicy(ActorCriticPolicy):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -123,6 +189,17 @@ class EWMARolloutBuffer(RolloutBuffer):
         self.ewma_var = 1.0
         self.ewma_count = 0
 
+    def reset(self) -> None:
+        super().reset()
+        # 观测按原始 dtype（8x10 的 uint8）存储，旧版本 SB3 默认 float32，占用 4 倍内存
+        if self.observations.dtype != self.observation_space.dtype:
+            self.observations = np.zeros(self.observations.shape, dtype=self.observation_space.dtype)
+
+    def _get_samples(self, batch_inds: np.ndarray, env=None) -> RolloutBufferSamples:
+        samples = super()._get_samples(batch_inds, env)
+        # 以 uint8 拷到设备上，再在设备上转成 float
+        return samples._replace(observations=samples.observations.float())
+
     def compute_returns_and_advantage(self, last_values: torch.Tensor, dones: np.ndarray) -> None:
         # Compute returns and advantages using parent method
         super().compute_returns_and_advantage(last_values, dones)
@@ -146,6 +223,37 @@ class EWMARolloutBuffer(RolloutBuffer):
         self.returns = (self.returns - self.ewma_mean) / (np.sqrt(self.ewma_var) + 1e-8)
 
 
+def _to_host(values, dtype) -> np.ndarray:
+    """把一组设备上的 0 维张量一次性拷回主机"""
+    if not values:
+        return np.array([], dtype=dtype)
+    return torch.stack(values).cpu().numpy().astype(dtype)
+
+
+def _optimizer_step_unless(optimizer, stop: torch.Tensor) -> None:
+    """
+    optimizer.step()，但 stop（设备上的 0 维布尔张量）为真时把参数和优化器状态还原成这一步之前，
+    效果等同于跳过这一步，判断不需要同步到主机。
+    与 stop 不在同一设备上的状态（例如 Adam 放在 CPU 上的 step 计数）不还原，由调用方按跳过的步数修正。
+    """
+    tensors = [param for group in optimizer.param_groups for param in group["params"]]
+    tensors += [value for state in optimizer.state.values() for value in state.values()
+                if torch.is_tensor(value) and value.device == stop.device]
+    saved = [tensor.detach().clone() for tensor in tensors]
+    optimizer.step()
+    with torch.no_grad():
+        for tensor, old in zip(tensors, saved):
+            tensor.copy_(torch.where(stop, old, tensor))
+
+
+def _rewind_host_steps(optimizer, device: torch.device, skipped: int) -> None:
+    """把不在 device 上的 step 计数减去被跳过的步数（见 _optimizer_step_unless）"""
+    for state in optimizer.state.values():
+        step = state.get("step")
+        if torch.is_tensor(step) and step.device != device:
+            step -= skipped
+
+
 class CustomPPO(PPO):
     def _setup_model(self) -> None:
         super()._setup_model()  # Initialize default components
@@ -161,6 +269,45 @@ class CustomPPO(PPO):
             ewma_decay=0.99  # As per your settings
         )
 
+    def collect_rollouts(self, env, callback, rollout_buffer, n_rollout_steps: int) -> bool:
+        # SharedMemVecEnv(rollout_steps=...) 带推理服务时由 worker 自行采样，否则走 SB3 默认流程
+        if getattr(env, "inference", None) is None or isinstance(env, VecEnvWrapper):
+            return super().collect_rollouts(env, callback, rollout_buffer, n_rollout_steps)
+
+        self.policy.set_training_mode(False)
+        rollout_buffer.reset()
+        callback.on_rollout_start()
+
+        # 推理服务在这里拿到上一次 train 之后的权重
+        episode_infos = env.collect(self.policy, n_rollout_steps, self.gamma)
+        rollout = env.rollout
+        for step in range(n_rollout_steps):
+            self.num_timesteps += env.num_envs
+            callback.update_locals(locals())
+            if not callback.on_step():
+                return False
+            rollout_buffer.add(
+                rollout["observations"][step],
+                rollout["actions"][step].reshape(-1, 1),
+                rollout["rewards"][step],
+                rollout["episode_starts"][step],
+                torch.as_tensor(rollout["values"][step]),
+                torch.as_tensor(rollout["log_probs"][step]),
+            )
+        self._update_info_buffer(episode_infos)
+        self._last_obs = env.buf_obs.copy()
+        self._last_episode_starts = env.buf_dones.copy()
+
+        with torch.no_grad():
+            # Compute value for the last timestep
+            values = self.policy.predict_values(obs_as_tensor(self._last_obs, self.device))
+
+        rollout_buffer.compute_returns_and_advantage(last_values=values, dones=self._last_episode_starts)
+
+        callback.update_locals(locals())
+        callback.on_rollout_end()
+        return True
+
 
     def train(self) -> None:
         """
@@ -178,14 +325,26 @@ class CustomPPO(PPO):
         if self.clip_range_vf is not None:
             clip_range_vf = self.clip_range_vf(self._current_progress_remaining)  # type: ignore[operator]
 
+        # 各项统计以 0 维张量留在设备上，整次更新结束后才一次性拷回主机，
+        # 避免每个 minibatch 的 .item() / .cpu() 同步
         entropy_losses = []
         pg_losses, value_losses = [], []
         clip_fractions = []
+        # 每个 minibatch 是否真正参与了更新（target_kl 触发提前停止之后的 minibatch 为 False）
+        active_flags = []
+
+        # target_kl 的提前停止在设备上判断：超过阈值之后的 minibatch 照常前向 / 反向，
+        # 但参数和优化器状态被还原（_optimizer_step_unless），每个 epoch 结束时才 .item() 一次决定是否停止
+        early_stop = self.target_kl is not None
+        stop = torch.zeros((), dtype=torch.bool, device=self.device)
+        last_loss = None
 
         continue_training = True
         # train for n_epochs epochs
         for epoch in range(self.n_epochs):
-            approx_kl_divs = []
+            approx_kl_divs, epoch_flags = [], []
+            skipped = torch.zeros((), dtype=torch.int64, device=self.device)
+            stop_kl = torch.zeros((), device=self.device)
             # Do a complete pass on the rollout buffer
             for rollout_data in self.rollout_buffer.get(self.batch_size):
                 actions = rollout_data.actions
@@ -210,8 +369,8 @@ class CustomPPO(PPO):
                 policy_loss = -torch.min(policy_loss_1, policy_loss_2).mean()
 
                 # Logging
-                pg_losses.append(policy_loss.item())
-                clip_fraction = torch.mean((torch.abs(ratio - 1) > clip_range).float()).item()
+                pg_losses.append(policy_loss.detach())
+                clip_fraction = torch.mean((torch.abs(ratio - 1) > clip_range).float())
                 clip_fractions.append(clip_fraction)
 
                 if self.clip_range_vf is None:
@@ -225,7 +384,7 @@ class CustomPPO(PPO):
                     )
                 # Value loss using the TD(gae_lambda) target
                 value_loss = F.mse_loss(rollout_data.returns, values_pred)
-                value_losses.append(value_loss.item())
+                value_losses.append(value_loss.detach())
 
                 # Entropy loss favor exploration
                 if entropy is None:
@@ -234,7 +393,7 @@ class CustomPPO(PPO):
                 else:
                     entropy_loss = -torch.mean(entropy)
 
-                entropy_losses.append(entropy_loss.item())
+                entropy_losses.append(entropy_loss.detach())
 
                 loss = policy_loss + self.ent_coef * entropy_loss + self.vf_coef * value_loss
 
@@ -244,35 +403,64 @@ class CustomPPO(PPO):
                 # and Schulman blog: http://joschu.net/blog/kl-approx.html
                 with torch.no_grad():
                     log_ratio = log_prob - rollout_data.old_log_prob
-                    approx_kl_div = torch.mean((torch.exp(log_ratio) - 1) - log_ratio).cpu().numpy()
+                    approx_kl_div = torch.mean((torch.exp(log_ratio) - 1) - log_ratio)
                     approx_kl_divs.append(approx_kl_div)
 
-                if self.target_kl is not None and approx_kl_div > 1.5 * self.target_kl:
-                    continue_training = False
-                    if self.verbose >= 1:
-                        print(f"Early stopping at step {epoch} due to reaching max kl: {approx_kl_div:.2f}")
-                    break
-
-                # Optimization step
+                if not early_stop:
+                    last_loss = loss.detach()
+                    # Optimization step
+                    self.policy.optimizer.zero_grad()
+                    loss.backward()
+                    # Clip grad norm
+                    torch.nn.utils.clip_grad_norm_(self.policy.parameters(), self.max_grad_norm)
+                    self.policy.optimizer.step()
+                    continue
+
+                # 与 SB3 相同：KL 超过阈值的这个 minibatch 的统计照常记录，但不再更新参数
+                active = ~stop
+                active_flags.append(active)
+                epoch_flags.append(active)
+                last_loss = loss.detach() if last_loss is None else torch.where(active, loss.detach(), last_loss)
+                exceeded = active & (approx_kl_div > 1.5 * self.target_kl)
+                stop_kl = torch.where(exceeded, approx_kl_div, stop_kl)
+                stop = stop | exceeded
+                skipped += stop
+
+                # Optimization step（stop 为真时被还原）
                 self.policy.optimizer.zero_grad()
                 loss.backward()
                 # Clip grad norm
                 torch.nn.utils.clip_grad_norm_(self.policy.parameters(), self.max_grad_norm)
-                self.policy.optimizer.step()
+                _optimizer_step_unless(self.policy.optimizer, stop)
 
             self._n_updates += 1
+            # 每个 epoch 只同步一次
+            if early_stop and stop.item():
+                continue_training = False
+                _rewind_host_steps(self.policy.optimizer, stop.device, int(skipped.item()))
+                approx_kl_divs = [kl for kl, kept in zip(approx_kl_divs, _to_host(epoch_flags, np.bool_)) if kept]
+                if self.verbose >= 1:
+                    print(f"Early stopping at step {epoch} due to reaching max kl: {stop_kl.item():.2f}")
             if not continue_training:
                 break
 
+        if early_stop:
+            # 去掉提前停止之后那些没有参与更新的 minibatch 的统计
+            kept = _to_host(active_flags, np.bool_)
+            entropy_losses, pg_losses, value_losses, clip_fractions = (
+                [value for value, keep in zip(values, kept) if keep]
+                for values in (entropy_losses, pg_losses, value_losses, clip_fractions)
+            )
+
         explained_var = explained_variance(self.rollout_buffer.values.flatten(), self.rollout_buffer.returns.flatten())
 
-        # Logs
-        self.logger.record("train/entropy_loss", np.mean(entropy_losses))
-        self.logger.record("train/policy_gradient_loss", np.mean(pg_losses))
-        self.logger.record("train/value_loss", np.mean(value_losses))
-        self.logger.record("train/approx_kl", np.mean(approx_kl_divs))
-        self.logger.record("train/clip_fraction", np.mean(clip_fractions))
-        self.logger.record("train/loss", loss.item())
+        # Logs（float64 求均值与逐个 .item() 之后的 np.mean 结果一致，approx_kl 保持 float32）
+        self.logger.record("train/entropy_loss", np.mean(_to_host(entropy_losses, np.float64)))
+        self.logger.record("train/policy_gradient_loss", np.mean(_to_host(pg_losses, np.float64)))
+        self.logger.record("train/value_loss", np.mean(_to_host(value_losses, np.float64)))
+        self.logger.record("train/approx_kl", np.mean(_to_host(approx_kl_divs, np.float32)))
+        self.logger.record("train/clip_fraction", np.mean(_to_host(clip_fractions, np.float64)))
+        self.logger.record("train/loss", last_loss.item())
         self.logger.record("train/explained_variance", explained_var)
         if hasattr(self.policy, "log_std"):
             self.logger.record("train/std", torch.exp(self.policy.log_std).mean().item())
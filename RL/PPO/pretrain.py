@@ -0,0 +1,33 @@
+from __future__ import annotations
+from typing import List
+
+import numpy as np
+import torch
+
+
+def behavior_cloning(policy, dataset, epochs: int = 1, batch_size: int = 512, learning_rate: float = 1e-4,
+                     rng: np.random.Generator | None = None) -> List[float]:
+    """
+    用离线数据集（envs/rollout_dataset.py 的 RolloutDataset）对策略做行为克隆预训练：
+    最大化数据里动作的 log_prob，特征提取器（CustomResNet 等）和动作头一起训练。
+    返回每个 epoch 的平均损失。
+    """
+    optimizer = torch.optim.Adam(policy.parameters(), lr=learning_rate)
+    policy.set_training_mode(True)
+    losses = []
+    for _ in range(epochs):
+        total, batches = torch.zeros((), device=policy.device), 0
+        for batch in dataset.batches(batch_size, rng=rng):
+            # 观测按原始 dtype 拷到设备上，由策略的预处理转成 float（与 EWMARolloutBuffer 一致）
+            observations = torch.as_tensor(batch["obs"], device=policy.device)
+            actions = torch.as_tensor(batch["action"].astype(np.int64), device=policy.device)
+            _, log_prob, _ = policy.evaluate_actions(observations, actions)
+            loss = -log_prob.mean()
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total += loss.detach()
+            batches += 1
+        losses.append(total.item() / max(batches, 1))
+    policy.set_training_mode(False)
+    return losses
@@ -0,0 +1,386 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# 用法（在仓库根目录运行，与 train.py 相同）：
+#   python RL/benchmark.py --save-baseline          # 生成 / 覆盖基线
+#   python RL/benchmark.py                          # 与基线比较，退化超过阈值时返回非零
+#   python RL/benchmark.py --only env pool          # 只跑部分项目
+#   python RL/benchmark.py --only arch              # 对比各特征提取器的 FLOPs / 参数量 / CPU 延迟
+#   python RL/benchmark.py --only import            # 检查裸 BaseEnv worker 的导入耗时预算
+
+GAME_FILE = "game_state/Link's awakening.gb"
+BASELINE_PATH = "record/benchmark/baseline.json"
+THRESHOLD = 0.15  # 允许的相对退化比例
+# 裸 BaseEnv worker（vec_worker + 房间环境，不带 Monitor）的导入耗时上限；大部分时间花在 PyBoy / SDL2 上
+IMPORT_BUDGET_MS = 1500
+# worker 进程里不应该出现的重量级模块
+HEAVY_MODULES = ("torch", "stable_baselines3", "matplotlib", "pynput")
+
+# (名称, 模块, 类名, 存档)
+ROOM_ENVS = [
+    ("env51_01", "envs.env51_01", "Room51_Task1_Env", "game_state/Room51_task1.state"),
+    ("env51_02", "envs.env51_02", "Room51_Task1_Env", "game_state/Room_51.state"),
+    ("env58_01", "envs.env58_01", "Room58_Task1_Env", "game_state/Room58_task1.state"),
+    ("env58_02", "envs.env58_02", "Room58_Task2_Env", "game_state/Room58_task2.state"),
+]
+
+# 与 train.py 保持一致的 PPO 设置
+PPO_SETTINGS = {"n_steps": 4096, "batch_size": 512, "n_epochs": 3, "features_dim": 1024}
+
+
+def _metric(value, unit, higher_is_better, budget=None):
+    metric = {"value": float(value), "unit": unit, "higher_is_better": higher_is_better}
+    if budget is not None:
+        metric["budget"] = budget  # 绝对上限，与基线无关
+    return metric
+
+
+def _best_of(fn, repeats):
+    """重复测量取最好的一次，减少机器抖动的影响"""
+    return min(fn() for _ in range(repeats))
+
+
+def bench_envs(steps=300, resets=20, repeats=3, seed=0):
+    import importlib
+
+    results = {}
+    for name, module_name, class_name, save_file in ROOM_ENVS:
+        env_class = getattr(importlib.import_module(module_name), class_name)
+        env = env_class(game_file=GAME_FILE, save_file=save_file)
+        rng = np.random.default_rng(seed)
+        actions = rng.integers(0, env.action_space.n, steps)
+
+        def run_steps():
+            env.reset()
+            start = time.perf_counter()
+            for action in actions:
+                _, _, terminated, truncated, _ = env.step(int(action))
+                if terminated or truncated:
+                    env.reset()
+            return (time.perf_counter() - start) / steps
+
+        def run_resets():
+            start = time.perf_counter()
+            for _ in range(resets):
+                env.reset()
+            return (time.perf_counter() - start) / resets
+
+        results[f"{name}/steps_per_sec"] = _metric(1.0 / _best_of(run_steps, repeats), "steps/s", True)
+        results[f"{name}/reset_ms"] = _metric(_best_of(run_resets, repeats) * 1e3, "ms", False)
+        env.close()
+    return results
+
+
+def bench_pooling(calls=2000, batch=16, repeats=5):
+    from envs.screen_abstract import ScreenPooler
+
+    pooler = ScreenPooler()
+    rng = np.random.default_rng(0)
+    # 与 pyboy.screen.ndarray[:, :, 0] 相同的带步长视图
+    screen = rng.integers(0, 256, (144, 160, 4), dtype=np.uint8)[:, :, 0]
+    screens = rng.integers(0, 256, (batch, 128, 160), dtype=np.uint8)
+
+    def single():
+        start = time.perf_counter()
+        for _ in range(calls):
+            pooler(screen)
+        return (time.perf_counter() - start) / calls
+
+    def batched():
+        start = time.perf_counter()
+        for _ in range(calls // batch):
+            pooler.pool_batch(screens)
+        return (time.perf_counter() - start) / (calls // batch * batch)
+
+    return {
+        "pool/single_us": _metric(_best_of(single, repeats) * 1e6, "us", False),
+        f"pool/batch{batch}_us_per_env": _metric(_best_of(batched, repeats) * 1e6, "us", False),
+    }
+
+
+def _make_extractor(observation_space):
+    from PPO.model import CustomResNet
+
+    return CustomResNet(observation_space, features_dim=PPO_SETTINGS["features_dim"])
+
+
+def bench_extractor(batch_sizes=(1, 64, 512), iters=20, repeats=3):
+    import torch
+    from gymnasium import spaces
+
+    observation_space = spaces.Box(low=0, high=255, shape=(8, 10), dtype=np.uint8)
+    model = _make_extractor(observation_space)
+    results = {}
+    for batch_size in batch_sizes:
+        obs = torch.rand(batch_size, 8, 10) * 255
+
+        def forward():
+            with torch.no_grad():
+                start = time.perf_counter()
+                for _ in range(iters):
+                    model(obs)
+                return (time.perf_counter() - start) / iters
+
+        def forward_backward():
+            start = time.perf_counter()
+            for _ in range(iters):
+                model.zero_grad()
+                model(obs).sum().backward()
+            return (time.perf_counter() - start) / iters
+
+        results[f"extractor/forward_b{batch_size}_ms"] = _metric(_best_of(forward, repeats) * 1e3, "ms", False)
+        results[f"extractor/fwd_bwd_b{batch_size}_ms"] = _metric(_best_of(forward_backward, repeats) * 1e3, "ms", False)
+    return results
+
+
+def _count_flops(model, input_shape):
+    """用前向 hook 统计 Conv2d / Linear 的乘加次数，返回 FLOPs（2 * MACs）"""
+    import torch
+    import torch.nn as nn
+
+    macs = []
+
+    def conv_hook(module, inputs, output):
+        kh, kw = module.kernel_size
+        macs.append(output.numel() * module.in_channels // module.groups * kh * kw)
+
+    def linear_hook(module, inputs, output):
+        macs.append(output.numel() * module.in_features)
+
+    handles = []
+    for m in model.modules():
+        if isinstance(m, nn.Conv2d):
+            handles.append(m.register_forward_hook(conv_hook))
+        elif isinstance(m, nn.Linear):
+            handles.append(m.register_forward_hook(linear_hook))
+    with torch.no_grad():
+        model(torch.zeros(1, *input_shape))
+    for handle in handles:
+        handle.remove()
+    return 2 * sum(macs)
+
+
+def bench_architectures(batch_sizes=(1, 64), iters=50, repeats=3, frame_stack=1):
+    """CustomResNet 与 CompactCNN 各预设的 FLOPs、参数量和 CPU 前向延迟"""
+    import torch
+    from gymnasium import spaces
+    from PPO.model import CustomResNet, CompactCNN, COMPACT_CNN_PRESETS
+
+    shape = (8, 10) if frame_stack == 1 else (frame_stack, 8, 10)
+    observation_space = spaces.Box(low=0, high=255, shape=shape, dtype=np.uint8)
+    models = {"resnet": CustomResNet(observation_space, features_dim=PPO_SETTINGS["features_dim"])}
+    for name, kwargs in COMPACT_CNN_PRESETS.items():
+        models[f"compact_{name}"] = CompactCNN(observation_space, **kwargs)
+
+    results = {}
+    for name, model in models.items():
+        model.eval()
+        results[f"arch/{name}/params"] = _metric(sum(p.numel() for p in model.parameters()), "params", False)
+        results[f"arch/{name}/mflops"] = _metric(_count_flops(model, shape) / 1e6, "MFLOPs", False)
+        for batch_size in batch_sizes:
+            obs = torch.rand(batch_size, *shape) * 255
+
+            def forward():
+                with torch.no_grad():
+                    start = time.perf_counter()
+                    for _ in range(iters):
+                        model(obs)
+                    return (time.perf_counter() - start) / iters
+
+            results[f"arch/{name}/forward_b{batch_size}_ms"] = _metric(_best_of(forward, repeats) * 1e3, "ms", False)
+    return results
+
+
+def _make_ppo(env, n_steps):
+    import torch
+    import torch.nn as nn
+    from stable_baselines3.common.logger import configure
+    from PPO.model import CustomResNet, CustomACPolicy, CustomPPO
+
+    policy_kwargs = {
+        "features_extractor_class": CustomResNet,
+        "features_extractor_kwargs": {"features_dim": PPO_SETTINGS["features_dim"]},
+        "activation_fn": nn.ReLU,
+        "net_arch": [],
+        "optimizer_class": torch.optim.Adam,
+        "optimizer_kwargs": {"eps": 1e-5},
+    }
+    model = CustomPPO(
+        CustomACPolicy,
+        env,
+        policy_kwargs=policy_kwargs,
+        n_steps=n_steps,
+        batch_size=PPO_SETTINGS["batch_size"],
+        n_epochs=PPO_SETTINGS["n_epochs"],
+        gamma=0.95,
+        gae_lambda=0.65,
+        normalize_advantage=False,
+    )
+    model.set_logger(configure(None, []))
+    return model
+
+
+def _fill_rollout_buffer(model, seed=0):
+    """用随机轨迹填满 rollout buffer（只测更新本身，不含采样）"""
+    import torch
+    from stable_baselines3.common.utils import obs_as_tensor
+
+    rng = np.random.default_rng(seed)
+    buffer = model.rollout_buffer
+    buffer.reset()
+    obs_shape = model.observation_space.shape
+    for _ in range(buffer.buffer_size):
+        obs = rng.integers(0, 256, (buffer.n_envs, *obs_shape), dtype=np.uint8)
+        with torch.no_grad():
+            actions, values, log_probs = model.policy(obs_as_tensor(obs, model.device))
+        rewards = rng.normal(size=buffer.n_envs).astype(np.float32)
+        episode_starts = rng.random(buffer.n_envs) < 0.01
+        buffer.add(obs, actions.cpu().numpy(), rewards, episode_starts, values, log_probs)
+    buffer.compute_returns_and_advantage(values, np.zeros(buffer.n_envs, dtype=bool))
+
+
+def bench_ppo_update(repeats=3):
+    from stable_baselines3.common.vec_env import DummyVecEnv
+    from envs.env58_02 import Room58_Task2_Env
+
+    env = DummyVecEnv([lambda: Room58_Task2_Env(game_file=GAME_FILE, save_file="game_state/Room58_task2.state")])
+    model = _make_ppo(env, PPO_SETTINGS["n_steps"])
+
+    def update():
+        _fill_rollout_buffer(model)
+        start = time.perf_counter()
+        model.train()
+        return time.perf_counter() - start
+
+    result = {"ppo/update_s": _metric(_best_of(update, repeats), "s", False)}
+    env.close()
+    return result
+
+
+_IMPORT_PROBE = """
+import json, sys, time
+sys.path.insert(0, "RL")
+start = time.perf_counter()
+import envs.vec_worker, envs.env58_02
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "heavy": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def bench_imports(repeats=3):
+    """在全新的解释器里导入 spawn worker 需要的模块，测量耗时并检查没有带进重量级框架"""
+    import subprocess
+
+    runs = []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, "-c", _IMPORT_PROBE % (HEAVY_MODULES,)],
+                             capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    heavy = sorted({name for run in runs for name in run["heavy"]})
+    if heavy:
+        print(f"  bare worker imported heavy modules: {', '.join(heavy)}")
+    return {
+        "import/bare_worker_ms": _metric(min(run["seconds"] for run in runs) * 1e3, "ms", False, budget=IMPORT_BUDGET_MS),
+        "import/heavy_modules": _metric(len(heavy), "modules", False, budget=0),
+    }
+
+
+def check_budgets(results):
+    """返回超过绝对上限的项目列表 (name, budget, value)"""
+    return [(name, metric["budget"], metric["value"]) for name, metric in results.items()
+            if "budget" in metric and metric["value"] > metric["budget"]]
+
+
+BENCHMARKS = {
+    "env": bench_envs,
+    "pool": bench_pooling,
+    "extractor": bench_extractor,
+    "arch": bench_architectures,
+    "import": bench_imports,
+    "ppo": bench_ppo_update,
+}
+
+
+def missing_from_baseline(results, baseline):
+    """本次跑了但基线里没有的项目（无法比较，视为失败，需要重新 --save-baseline）"""
+    return [name for name in results if name not in baseline]
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """返回退化超过阈值的项目列表 (name, baseline, current, change)，基线里没有的项目见 missing_from_baseline"""
+    regressions = []
+    for name, metric in results.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name]["value"], metric["value"]
+        if old == 0:
+            continue
+        # change > 0 表示变差
+        change = (old - new) / old if metric["higher_is_better"] else (new - old) / old
+        if change > threshold:
+            regressions.append((name, old, new, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput benchmarks for envs, pooling, extractor and PPO update")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="run only these groups")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="overwrite the baseline with this run")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed relative regression")
+    parser.add_argument("--output", help="also write this run's results to a JSON file")
+    args = parser.parse_args()
+
+    results = {}
+    for group in args.only or list(BENCHMARKS):
+        print(f"Running {group} benchmarks...")
+        results.update(BENCHMARKS[group]())
+
+    for name, metric in results.items():
+        print(f"  {name:36s} {metric['value']:12.3f} {metric['unit']}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    over_budget = check_budgets(results)
+    for name, budget, value in over_budget:
+        print(f"OVER BUDGET {name}: {value:.3f} > {budget}")
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 1 if over_budget else 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline first")
+        return 1 if over_budget else 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    missing = missing_from_baseline(results, baseline)
+    for name in missing:
+        print(f"MISSING BASELINE {name}: not in {args.baseline}; run with --save-baseline to add it")
+    regressions = compare(results, baseline, args.threshold)
+    for name, old, new, change in regressions:
+        print(f"REGRESSION {name}: {old:.3f} -> {new:.3f} ({change:+.1%} worse)")
+    if regressions or missing or over_budget:
+        return 1
+    print("No regressions above threshold")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,33 +3,90 @@ import numpy as np
 from abc import ABC, abstractmethod
 from typing import Tuple, Dict, Any
 from pyboy import PyBoy
+import io
 import json
+import math
+import pickle
 import os
 from pathlib import Path
 import gymnasium as gym
 from gymnasium import spaces
 from pyboy.utils import WindowEvent
 #from skimage.transform import downscale_local_mean
-from .screen_abstract import gamearea_abstract
-import torch
+from .screen_abstract import ScreenPooler
+from .profiling import StepTimer
+from .explore_archive import CellArchive
+from .frame_stack import FrameRing
+from .fork_server import take_prebooted
+from .visit_map import TileBitmap, VisitCounts
+from .memory_map import (
+    MemoryMap,
+    RAM_OBS_SIZE,
+    ADDR_CUR_HEALTH,
+    ADDR_MAX_HEALTH,
+    ADDR_RUPEE,
+    ADDR_ROOM_ID,
+    ADDR_KEYS,
+)
 # 通用常量
 TOTAL_STEPS = 3_000_000
 MAX_STEPS = 5_000
 
-# 内存地址（命名化，便于复用/维护）
-ADDR_CUR_HEALTH = 0xDB5A
-ADDR_MAX_HEALTH = 0xDB5B
-ADDR_RUPEE      = 0xDB5E
-ADDR_ROOM_ID    = 0xDBAE
-ADDR_KEYS       = 0xDBD0
+# 存档缓存：同一进程内的所有环境共享，fork 出来的 worker 直接继承，不再重复读盘
+_STATE_CACHE: Dict[str, bytes] = {}
+
+def load_state_bytes(path: str) -> bytes:
+    """读取存档文件的字节内容（首次读盘，之后命中缓存）"""
+    key = os.path.abspath(path)
+    data = _STATE_CACHE.get(key)
+    if data is None:
+        with open(path, "rb") as f:
+            data = f.read()
+        _STATE_CACHE[key] = data
+    return data
+
+def preload_states(*paths: str):
+    """在创建 worker 之前预先缓存存档"""
+    for path in paths:
+        load_state_bytes(path)
 
 class BaseEnv(gym.Env, ABC):
     metadata = {"render_modes": ["human", "rgb_array"], "render_fps": 30}
-
-    def __init__(self, game_file: str, save_file: str, goal_room: int | None = None, render_mode: str | None = None):
+    # 需要实体表（怪物统计）的房间置为 True，随每步的内存快照一起刷新
+    read_entities = False
+    # 随档案格子一起保存的任务状态属性（例如按钮是否已踩下），从格子开始时恢复，内存里读不出来的状态放这里
+    cell_fields: Tuple[str, ...] = ()
+
+    def __init__(self, game_file: str, save_file: str, goal_room: int | None = None, render_mode: str | None = None,
+                 press_frames: int = 10, release_frames: int = 10, render_all_frames: bool = False,
+                 profile: bool = False, archive_size: int = 0, archive_reset_prob: float = 0.5,
+                 frame_stack: int = 1, obs_mode: str = "screen", pyboy: PyBoy | None = None,
+                 visit_counts: VisitCounts | None = None):
         super().__init__()
         self.game_file = game_file
         self.save_file = save_file
+        self.loaded_state = save_file       # 本回合使用的存档文件；从档案格子开始时为 None
+        self.loaded_state_data: bytes | None = None  # 本回合起点的存档字节（回放时需要）
+        self.start_cell = None              # 本回合起点的档案格子
+
+        # 每个动作按下 / 松开各持续的帧数（即 frame skip）
+        self.press_frames = press_frames
+        self.release_frames = release_frames
+        # 默认只渲染观测真正会读取的最后一帧，中间帧关闭 PPU 渲染
+        self.render_all_frames = render_all_frames or render_mode == "human"
+        # obs_mode="ram"：观测直接从内存构造，模拟时完全不渲染画面（需要画面时把 render_screen 置 True）
+        if obs_mode not in ("screen", "ram"):
+            raise ValueError(f"Unknown obs_mode: {obs_mode}")
+        # 叠帧后的 (k, 8, 10) 只有 k 不超过 8 时才会被 SB3 当作通道在前的图像，否则 VecTransposeImage 会转置错维度
+        if obs_mode == "screen" and frame_stack > 8:
+            raise ValueError(f"frame_stack must be at most 8 for screen observations, got {frame_stack}")
+        self.obs_mode = obs_mode
+        self.render_screen = obs_mode == "screen" or render_mode is not None
+        # 分阶段计时（profile=True 时开启，回合结束时放进 info["timing"]）
+        self.timer = StepTimer() if profile else None
+        # 探索档案（archive_size > 0 时开启）：新格子存档，reset 时以 archive_reset_prob 的概率从档案格子开始
+        self.archive = CellArchive(archive_size) if archive_size > 0 else None
+        self.archive_reset_prob = archive_reset_prob
 
         self.render_mode = render_mode
         if self.render_mode == "human":
@@ -38,28 +95,39 @@ class BaseEnv(gym.Env, ABC):
             window_mode = "null"
         else:
             window_mode = "null"
-        self.pyboy = PyBoy(game_file, sound_emulated=False, window=window_mode)
-        if window_mode == "SDL2":
+        # 可以传入已经启动的模拟器（多任务时同一 worker 的各房间环境共用一个 PyBoy，每次 reset 都会重新读档）；
+        # 在 EmulatorForkServer fork 出来的进程里直接取用模板进程预启动的模拟器
+        if pyboy is None and window_mode == "null":
+            pyboy = take_prebooted(game_file)
+        self.pyboy = pyboy if pyboy is not None else PyBoy(game_file, sound_emulated=False, window=window_mode)
+        self.ram = MemoryMap(read_entities=self.read_entities or obs_mode == "ram")
+        self.entity_table = self.ram.entities
+        if window_mode == "SDL2" and pyboy is None:
             self.pyboy.set_emulation_speed(1) # 当渲染图像时设置为正常速度
         try:
-            with open(save_file, "rb") as f:
-                self.pyboy.load_state(f)
+            self.loaded_state_data = load_state_bytes(save_file)
+            self.pyboy.load_state(io.BytesIO(self.loaded_state_data))
         except FileNotFoundError:
             print("No existing save file, starting new game")
+        self.ram.update(self.pyboy)
 
-        self.max_health = self.read_m(ADDR_MAX_HEALTH)
-        self.pre_health = self.read_m(ADDR_CUR_HEALTH)
+        self.max_health = self.ram["max_health"]
+        self.pre_health = self.ram["health"]
         self.cur_health = self.pre_health
 
-        self.pre_rupee = self.read_m(ADDR_RUPEE)
+        self.pre_rupee = self.ram["rupees"]
         self.cur_rupee = self.pre_rupee
 
-        self.cur_room = self.read_m(ADDR_ROOM_ID)
+        self.cur_room = self.ram["room"]
         self.goal_room = self.cur_room if goal_room is None else goal_room
         self.out_side = 0
 
         self.visited_rooms: set[int] = set()
-        self.visited_tiles: set[tuple[int, int, int]] = set()  # (room_id, tile_x, tile_y)
+        self.visited_tiles = TileBitmap()  # 本回合到过的 (room_id, tile_x, tile_y)
+        # 所有 worker 共享的全局访问计数（可选），tile_visits 为当前格子加上本步之后的总次数
+        self.visit_counts = visit_counts
+        self.tile_visits = 0
+        self._update_tile()
         
         # 计算距离变化信息
         self.target_pos = None
@@ -85,8 +153,18 @@ class BaseEnv(gym.Env, ABC):
         ]
         self.action_space = spaces.Discrete(len(self.valid_actions))
 
+        self.pooler = ScreenPooler(128, 160, size=16, sigma=4)
+        if obs_mode == "ram":
+            # Link 状态 + 实体表，见 memory_map.RAM_OBS_FIELDS
+            self.ram_obs = np.zeros(RAM_OBS_SIZE, dtype=np.float32)
+            frame_shape, low, high, dtype = self.ram_obs.shape, -1.0, 1.0, np.float32
+        else:
+            frame_shape, low, high, dtype = self.pooler.shape, 0, 255, np.uint8
+        # frame_stack > 1 时观测为最近 k 帧 (k, 8, 10)，由预分配的环形缓冲区提供
+        self.frames = FrameRing(frame_stack, frame_shape, dtype=dtype) if frame_stack > 1 else None
+        obs_shape = self.frames.shape if self.frames is not None else frame_shape
         self.observation_space = spaces.Box(
-            low=0, high=255, shape=(8, 10), dtype=np.uint8  # 修改为卷积后的形状
+            low=low, high=high, shape=obs_shape, dtype=dtype  # 修改为卷积后的形状
         )
         # 训练计数
         self.cur_step = 0
@@ -95,36 +173,112 @@ class BaseEnv(gym.Env, ABC):
 
     # Gym API 接口
     def reset(self, seed: int | None = None, options: dict | None = None):
+        # 断点续训：options["snapshot"] 为 snapshot() 的结果，恢复后回合从快照处继续
+        if options and options.get("snapshot") is not None:
+            observation = self.restore_snapshot(options["snapshot"])
+            return observation, self._get_info()
         super().reset(seed=seed)
         if seed is not None:
             np.random.seed(seed)
 
         self.cur_step = 0
         self.episode += 1
+        timer = self.timer
+        if timer:
+            timer.start()
+
+        # options 可以通过 "save_file" 指定存档文件，"state" 指定存档字节，"cell" 指定档案格子；
+        # 都没有时按 archive_reset_prob 的概率从档案里抽一个格子
+        options = options or {}
+        archive = self.archive
+        cell = None
+        if options.get("state") is not None:
+            self.load_state_data(options["state"])
+        elif options.get("cell") is not None:
+            if archive is None:
+                raise ValueError("options['cell'] requires an exploration archive (archive_size > 0)")
+            key = tuple(options["cell"])
+            cell = archive.get(key)
+            self.load_state_data(cell.state, cell=key)
+        elif options.get("save_file"):
+            self.load_state(options["save_file"])
+        elif archive and self.np_random.random() < self.archive_reset_prob:
+            key, cell = archive.sample(self.np_random)
+            self.load_state_data(cell.state, cell=key)
+        else:
+            self.load_state(self.save_file)
 
-        with open(self.save_file, "rb") as f:
-            self.pyboy.load_state(f)
-        self.pyboy.tick(1)
+        # 给子类的扩展复位选择（也可以在这里调用 load_state 换成别的存档）
+        self._reset_extra(options)
+        # 从档案格子开始时恢复存档那一刻的任务状态
+        if cell is not None:
+            self.__dict__.update(cell.extra)
+        if self.frames is not None:
+            self.frames.fill(self._observe())
+        if timer:
+            timer.lap("reset")
+
+        observation = self._get_obs()
+        info = self._get_info()
+        return observation, info
+
+    def load_state(self, save_file: str):
+        """从内存缓存恢复存档，并同步通用状态"""
+        self.load_state_data(load_state_bytes(save_file))
+        self.loaded_state = save_file  # 记录本回合实际使用的存档（回放时需要）
+
+    def load_state_data(self, data: bytes, cell=None):
+        """从存档字节恢复（档案格子 / 回放内嵌的存档），并同步通用状态"""
+        self.pyboy.load_state(io.BytesIO(data))
+        self.loaded_state = None
+        self.loaded_state_data = data
+        self.start_cell = cell
+        self.pyboy.tick(1, self.render_screen)
+        self.ram.update(self.pyboy)
+        self._update_tile()
 
         # 通用状态复位
-        self.cur_room = self.read_m(ADDR_ROOM_ID)
+        self.cur_room = self.ram["room"]
         if self.goal_room is None:
             self.goal_room = self.cur_room
         self.visited_rooms.clear()
         self.visited_tiles.clear()
 
-        self.pre_health = self.read_m(ADDR_CUR_HEALTH)
+        self.pre_health = self.ram["health"]
         self.cur_health = self.pre_health
-        self.pre_rupee = self.read_m(ADDR_RUPEE)
+        self.pre_rupee = self.ram["rupees"]
         self.cur_rupee = self.pre_rupee
         self.out_side = 0
 
-        # 给子类的扩展复位选择
-        self._reset_extra(options)
-
-        observation = self._get_obs()
-        info = self._get_info()
-        return observation, info
+    # 不进快照的属性：模拟器通过存档恢复，全局访问计数属于整个训练而不是某个环境
+    _SNAPSHOT_EXCLUDE = ("pyboy", "visit_counts")
+
+    def snapshot(self, emulator: bool = True) -> bytes:
+        """
+        当前时刻的完整快照：模拟器存档 + 环境自身的状态（计数、访问记录、档案、随机数状态等），
+        用 reset(options={"snapshot": data}) 恢复，训练检查点用它保存进行中的回合。
+        emulator=False 时不保存模拟器（多任务时共用模拟器的其他任务环境）
+        """
+        state = None
+        if emulator:
+            buffer = io.BytesIO()
+            self.pyboy.save_state(buffer)
+            state = buffer.getvalue()
+        return pickle.dumps({
+            "state": state,
+            "env": {key: value for key, value in self.__dict__.items() if key not in self._SNAPSHOT_EXCLUDE},
+            "observation": np.array(self._get_obs()),
+            "np_global": np.random.get_state(),
+        })
+
+    def restore_snapshot(self, data: bytes) -> np.ndarray:
+        """恢复 snapshot() 保存的状态，返回快照时刻的观测"""
+        snapshot = pickle.loads(data)
+        if snapshot["state"] is not None:
+            self.pyboy.load_state(io.BytesIO(snapshot["state"]))
+        self.__dict__.update(snapshot["env"])
+        np.random.set_state(snapshot["np_global"])
+        return snapshot["observation"]
 
     # 子类覆盖此钩子做额外复位（默认无操作）
     def _reset_extra(self, options: dict | None):
@@ -136,28 +290,62 @@ class BaseEnv(gym.Env, ABC):
 
         self.pre_health = self.cur_health
         self.pre_rupee = self.cur_rupee
+        timer = self.timer
+        if timer:
+            timer.start()
 
         self.run_action(action)
+        if timer:
+            timer.lap("emulate")
+        # 每步只读取一次内存快照，之后的判定都基于 self.ram
+        self.ram.update(self.pyboy)
+        if timer:
+            timer.lap("ram")
         self._step_extra()
+        if timer:
+            timer.lap("step_extra")
         # 更新核心状态
-        self.cur_health = self.read_m(ADDR_CUR_HEALTH)
-        self.cur_room = self.read_m(ADDR_ROOM_ID)
-        self.cur_rupee = self.read_m(ADDR_RUPEE)
+        self.cur_health = self.ram["health"]
+        self.cur_room = self.ram["room"]
+        self.cur_rupee = self.ram["rupees"]
         self.visited_rooms.add(self.cur_room)
+        self._update_tile()
+        if self.visit_counts is not None:
+            self.tile_visits = self.visit_counts.add(self.cur_room, self.tile_x, self.tile_y)
 
         # 奖励与终止判定（由子类决定奖励构成）
         reward, terminated = self.calculate_reward()
 
         # 截断：通用的最大步数限制
         truncated = self.cur_step >= MAX_STEPS
-
+        if timer:
+            timer.lap("reward")
+        if self.archive is not None and not terminated:
+            self._archive_cell()
+            if timer:
+                timer.lap("archive")
+
+        if self.frames is not None:
+            self.frames.push(self._observe())
         observation = self._get_obs()
+        if timer:
+            timer.lap("obs")
         info = self._get_info()
+        if timer:
+            timer.lap("info")
+            timer.end_step(self.press_frames + self.release_frames)
+            if terminated or truncated:
+                info["timing"] = timer.end_episode()
         return observation, reward, terminated, truncated, info
     
     def _step_extra(self):
         pass
 
+    @property
+    def task_env(self) -> "BaseEnv":
+        """实际在跑的房间环境；MultiTaskEnv 里为当前任务的环境，回放 / 录制按它记录"""
+        return self
+
     def render(self):
         if self.render_mode == "human":
             pass
@@ -169,6 +357,22 @@ class BaseEnv(gym.Env, ABC):
     def close(self):
         self.pyboy.stop()
 
+    def _archive_cell(self):
+        """记录当前格子的访问次数，第一次走到的格子存档（死亡 / 完成任务的状态不存）"""
+        tile_x, tile_y = self._get_tile()
+        key = (int(self.cur_room), tile_x, tile_y)
+        if self.archive.visit(key) and not self.is_dead():
+            self.archive.add_from(key, self.pyboy, {name: getattr(self, name) for name in self.cell_fields})
+
+    def get_timing_stats(self, window: bool = False) -> Dict[str, float] | None:
+        """
+        分阶段计时的汇总（未开启 profile 时返回 None）。
+        window=True 时返回上次调用之后的增量并清零，供回调按 rollout 写入 TensorBoard。
+        """
+        if self.timer is None:
+            return None
+        return self.timer.pop_window() if window else self.timer.summary()
+
     @abstractmethod
     def check_goal(self) -> bool:
         """任务是否完成"""
@@ -184,11 +388,20 @@ class BaseEnv(gym.Env, ABC):
         """默认无距离"""
         return 0.0
 
-    def _get_obs(self):
+    def _observe(self) -> np.ndarray:
+        # ram 模式：由本步的内存快照构造观测向量
+        if self.obs_mode == "ram":
+            return self.ram.observation(self.ram_obs)
         # 当前的方案是对 screen 进行一个 16 * 16 的高斯卷积操作，降维到（8 * 10）
-        screen_tensor = torch.tensor(self.pyboy.screen.ndarray[:128, :160, 0], dtype=torch.float32)
-        pooled = gamearea_abstract(screen_tensor)
-        return pooled
+        # 直接在屏幕缓冲区的视图上池化，结果写在 pooler 的缓冲区里
+        return self.pooler(self.pyboy.screen.ndarray[:, :, 0])
+
+    def _get_obs(self):
+        # 叠帧时返回环形缓冲区的视图（step / reset 中已经压入当前帧，下一步之前有效）；
+        # 单帧时返回副本，避免调用方持有的观测被下一步覆盖
+        if self.frames is not None:
+            return self.frames.view()
+        return self._observe().copy()
     
     def _get_info(self):
         return {
@@ -197,23 +410,42 @@ class BaseEnv(gym.Env, ABC):
         }
 
     def _get_pos(self) -> Tuple[int, int]:
-        sprite = self.pyboy.get_sprite(2)
-        return sprite.x, sprite.y
+        return self.ram["link_x"], self.ram["link_y"]
+
+    def _update_tile(self):
+        # 每次刷新内存快照后算一次所在格子，本步的判定直接读 tile_x / tile_y
+        self.tile_x = max(0, self.ram["link_x"]) >> 3
+        self.tile_y = max(0, self.ram["link_y"]) >> 3
 
     def _get_tile(self) -> Tuple[int, int]:
-        x, y = self._get_pos()
-        tile_x = int(max(0, x) // 8)
-        tile_y = int(max(0, y) // 8)
-        return tile_x, tile_y
+        return self.tile_x, self.tile_y
 
     def run_action(self, action: int):
         self.pyboy.send_input(self.valid_actions[action])
-        self.pyboy.tick(10)
-        self.pyboy.send_input(self.release_actions[action])
-        self.pyboy.tick(10)
+        if self.release_frames > 0:
+            self._tick(self.press_frames, render_last=False)
+            self.pyboy.send_input(self.release_actions[action])
+            self._tick(self.release_frames)
+        else:
+            self._tick(self.press_frames)
+            self.pyboy.send_input(self.release_actions[action])
+
+    def _tick(self, frames: int, render_last: bool = True):
+        """推进若干帧，除最后一帧外不做渲染（human 模式或 render_all_frames 时逐帧渲染）"""
+        if frames <= 0:
+            return
+        if not self.render_screen:
+            self.pyboy.tick(frames, False)
+            return
+        if self.render_all_frames:
+            # pyboy.tick(n, True) 只渲染最后一帧，逐帧渲染要一帧一帧地推进
+            for _ in range(frames):
+                self.pyboy.tick(1, True)
+            return
+        self.pyboy.tick(frames, render_last)
 
     def is_dead(self) -> bool:
-        return self.read_m(ADDR_CUR_HEALTH) == 0
+        return self.ram["health"] == 0
 
     def is_hurt(self) -> int:
         """返回生命变化，非负值化为0"""
@@ -237,13 +469,15 @@ class BaseEnv(gym.Env, ABC):
     def tile_explore_bonus(self) -> bool:
         """探索区域奖励"""
         if self.cur_room == self.goal_room:
-            tile_x, tile_y = self._get_tile()
-            key = (int(self.cur_room), tile_x, tile_y)
-            if key not in self.visited_tiles:
-                self.visited_tiles.add(key)
-                return True
+            return self.visited_tiles.add(self.cur_room, self.tile_x, self.tile_y)
         return False
 
+    def count_explore_bonus(self, scale: float = 0.01) -> float:
+        """基于全局访问计数的探索奖励 scale / sqrt(N)，N 为所有 worker 到过当前格子的总步数（需要 visit_counts）"""
+        if self.tile_visits == 0:
+            return 0.0
+        return scale / math.sqrt(self.tile_visits)
+
     def rupee_gained(self) -> bool:
         """检测卢比是否增长"""
         gained = self.cur_rupee > self.pre_rupee
@@ -0,0 +1,62 @@
+from __future__ import annotations
+import numpy as np
+
+# 活动实体表（WRAM）：16 个槽位，每个字段单独一张 16 字节的表
+ENTITY_SLOTS = 16
+ADDR_ENTITY_POS_X  = 0xC200
+ADDR_ENTITY_POS_Y  = 0xC210
+ADDR_ENTITY_STATUS = 0xC280
+ADDR_ENTITY_STATE  = 0xC290
+ADDR_ENTITY_HEALTH = 0xC360
+ADDR_ENTITY_TYPE   = 0xC3A0
+
+# 实体状态：0 为空槽位，1 正在死亡，2 正在掉落（掉进坑里），其余为存活
+ENTITY_STATUS_DISABLED = 0
+ENTITY_STATUS_DYING    = 1
+ENTITY_STATUS_FALLING  = 2
+
+# 实体类型
+ENTITY_SLIME  = 0x1C  # 51 号房间的粘液怪
+ENTITY_TURTLE = 0x20  # 51 / 58 号房间的乌龟（甲虫）
+
+ENTITY_DTYPE = np.dtype([
+    ("type",   np.uint8),
+    ("x",      np.uint8),
+    ("y",      np.uint8),
+    ("health", np.uint8),
+    ("status", np.uint8),
+    ("state",  np.uint8),
+])
+
+_FIELD_ADDRS = {
+    "type":   ADDR_ENTITY_TYPE,
+    "x":      ADDR_ENTITY_POS_X,
+    "y":      ADDR_ENTITY_POS_Y,
+    "health": ADDR_ENTITY_HEALTH,
+    "status": ADDR_ENTITY_STATUS,
+    "state":  ADDR_ENTITY_STATE,
+}
+
+
+class EntityTable:
+    """
+    把游戏的活动实体表解码成 (16,) 的结构化数组（type / x / y / health / status / state），
+    怪物数量和击杀判定都基于这张表，不再依赖 game_area 的像素阈值估计。
+    """
+    def __init__(self):
+        self.entities = np.zeros(ENTITY_SLOTS, dtype=ENTITY_DTYPE)
+
+    def update(self, pyboy):
+        """从模拟器读取实体表（每个字段一次 16 字节切片，跳过中间用不到的表）"""
+        memory = pyboy.memory
+        for name, addr in _FIELD_ADDRS.items():
+            self.entities[name] = memory[addr:addr + ENTITY_SLOTS]
+        return self.entities
+
+    def alive_mask(self) -> np.ndarray:
+        status = self.entities["status"]
+        return status > ENTITY_STATUS_FALLING
+
+    def count(self, entity_type: int) -> int:
+        """统计某类存活实体的数量"""
+        return int(np.count_nonzero(self.alive_mask() & (self.entities["type"] == entity_type)))
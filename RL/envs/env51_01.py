@@ -1,6 +1,6 @@
 from __future__ import annotations
 from typing import Tuple
-from .base_env import BaseEnv, ADDR_KEYS
+from .base_env import BaseEnv
 
 class Room51_Task1_Env(BaseEnv):
     """
@@ -9,8 +9,11 @@ class Room51_Task1_Env(BaseEnv):
         打开宝箱（130，40）
         获得key
     """
-    def __init__(self, game_file: str, save_file: str, render_mode: str | None = None, goal_room: int | None = 51):
-        super().__init__(game_file, save_file, goal_room=goal_room, render_mode=render_mode)
+    # 按钮踩下后就不再能从内存或位置判断，随档案格子一起保存
+    cell_fields = ("flag",)
+
+    def __init__(self, game_file: str, save_file: str, render_mode: str | None = None, goal_room: int | None = 51, **kwargs):
+        super().__init__(game_file, save_file, goal_room=goal_room, render_mode=render_mode, **kwargs)
         # 怪物统计的初始值
         self.flag = False
         self.pre_distance1 = self.get_distance(80, 45)
@@ -21,7 +24,7 @@ class Room51_Task1_Env(BaseEnv):
 
     # 任务完成：这里暂以钥匙数量 >= 1 为达成
     def check_goal(self) -> bool:
-        return self.read_m(ADDR_KEYS) >= 1
+        return self.ram["keys"] >= 1
 
     # 可选：房间内的曼哈顿距离（如用于形状奖励），按你原逻辑自定义
     def get_distance(self, target_x: int | None = None, target_y: int | None = None) -> float:
@@ -1,7 +1,7 @@
 from __future__ import annotations
 from typing import Tuple
-import numpy as np
-from .base_env import BaseEnv, ADDR_KEYS
+from .base_env import BaseEnv
+from .entities import ENTITY_SLIME, ENTITY_TURTLE
 
 class Room51_Task1_Env(BaseEnv):
     """
@@ -10,8 +10,10 @@ class Room51_Task1_Env(BaseEnv):
         打开宝箱（130，40）
         获得key
     """
-    def __init__(self, game_file: str, save_file: str, render_mode: str | None = None, goal_room: int | None = 51):
-        super().__init__(game_file, save_file, goal_room=goal_room, render_mode=render_mode)
+    read_entities = True
+
+    def __init__(self, game_file: str, save_file: str, render_mode: str | None = None, goal_room: int | None = 51, **kwargs):
+        super().__init__(game_file, save_file, goal_room=goal_room, render_mode=render_mode, **kwargs)
         # 怪物统计的初始值
         self.slimes, self.turtles = self._get_monsters()
 
@@ -22,7 +24,7 @@ class Room51_Task1_Env(BaseEnv):
 
     # 任务完成：这里暂以钥匙数量 >= 1 为达成
     def check_goal(self) -> bool:
-        return self.read_m(ADDR_KEYS) >= 1
+        return self.ram["keys"] >= 1
 
     # 可选：房间内的曼哈顿距离（如用于形状奖励），按你原逻辑自定义
     def get_distance(self) -> float:
@@ -43,7 +45,7 @@ class Room51_Task1_Env(BaseEnv):
         # 2) 受伤小惩罚（is_hurt 为负数）
         reward += 0.01 * self.is_hurt()
 
-        # 3) 击杀怪物奖励（基于图像阈值的数量估计）
+        # 3) 击杀怪物奖励（基于实体表的数量统计）
         reward += self._monster_kill_bonus()
 
         # 4) 拾取卢比小奖励
@@ -74,19 +76,13 @@ class Room51_Task1_Env(BaseEnv):
 
     # ---- 房间 51 专属辅助 ----
     def _get_monsters(self):
-        # 返回 (slimes, turtles) 的粗略估计
-        game_area = self.pyboy.game_area()
-        sub_area = game_area[:20, :20]
-        thresholds = [85, 170]
-        labels = np.digitize(sub_area, thresholds)
-        count_0 = np.count_nonzero(labels == 0)
-        count_1 = np.count_nonzero(labels == 1)
-        slimes = (count_1 + 1) // 2
-        turtles = (count_0 - 1) // 4
-        return slimes, turtles
+        # 返回本步实体表快照中存活的 (slimes, turtles) 数量
+        return self.entity_table.count(ENTITY_SLIME), self.entity_table.count(ENTITY_TURTLE)
 
     def _monster_kill_bonus(self) -> float:
         """比对当前与历史数量，减少则给奖励，并更新基准"""
+        if self.cur_room != self.goal_room:
+            return 0.0
         cur_slimes, cur_turtles = self._get_monsters()
         bonus = 0.0
         if cur_turtles < self.turtles:
@@ -1,7 +1,7 @@
 from __future__ import annotations
 from typing import Tuple
 import numpy as np
-from .base_env import BaseEnv, ADDR_KEYS
+from .base_env import BaseEnv
 
 class Room58_Task1_Env(BaseEnv):
     """
@@ -9,8 +9,8 @@ class Room58_Task1_Env(BaseEnv):
         走到位置(30,45)处
         获得key
     """
-    def __init__(self, game_file: str, save_file: str, render_mode: str | None = None, goal_room: int | None = 58):
-        super().__init__(game_file, save_file, goal_room=goal_room, render_mode=render_mode)
+    def __init__(self, game_file: str, save_file: str, render_mode: str | None = None, goal_room: int | None = 58, **kwargs):
+        super().__init__(game_file, save_file, goal_room=goal_room, render_mode=render_mode, **kwargs)
         # self.slimes, self.turtles = self._get_monsters()
         self.target_pos = (30,45)
         self.pre_distance = None
@@ -22,7 +22,7 @@ class Room58_Task1_Env(BaseEnv):
         self.cur_distance = self.pre_distance
 
     def check_goal(self) -> bool:
-        return self.read_m(ADDR_KEYS) >= 1
+        return self.ram["keys"] >= 1
 
     def get_distance(self) -> float:
         x, y = self._get_pos()
@@ -1,11 +1,17 @@
 from __future__ import annotations
 from typing import Tuple
-import numpy as np
 from .base_env import BaseEnv
+from .entities import ENTITY_TURTLE
 
 class Room58_Task2_Env(BaseEnv):
-    def __init__(self, game_file: str, save_file: str, render_mode: str | None = None, goal_room: int | None = 58):
-        super().__init__(game_file, save_file, goal_room=goal_room, render_mode=render_mode)
+    read_entities = True
+
+    def __init__(self, game_file: str, save_file: str, render_mode: str | None = None, goal_room: int | None = 58, **kwargs):
+        super().__init__(game_file, save_file, goal_room=goal_room, render_mode=render_mode, **kwargs)
+        self.turtles = self._get_monsters()
+
+    def _reset_extra(self, options=None):
+        # 起点（存档 / 档案格子）的乌龟数量从实体表重新统计，不沿用上一回合的计数
         self.turtles = self._get_monsters()
 
     def check_goal(self) -> bool:
@@ -42,15 +48,13 @@ class Room58_Task2_Env(BaseEnv):
         return reward, terminated
 
     def _get_monsters(self):
-        game_area = self.pyboy.game_area()
-        sub_area = game_area[:20, :20]
-        thresholds = [85, 170]
-        labels = np.digitize(sub_area, thresholds)
-        count_0 = np.count_nonzero(labels == 0)
-        turtles = (count_0 - 1) // 4
-        return turtles
+        # 从本步的实体表快照统计存活的乌龟数量
+        return self.entity_table.count(ENTITY_TURTLE)
 
     def _monster_kill_bonus(self) -> float:
+        # 不在目标房间时实体表是别的房间的，不参与击杀判定
+        if self.cur_room != self.goal_room:
+            return 0.0
         cur_turtles = self._get_monsters()
         bonus = 0.0
         if cur_turtles < self.turtles:
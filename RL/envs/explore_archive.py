@@ -0,0 +1,83 @@
+from __future__ import annotations
+import io
+from typing import Dict, Tuple
+
+import numpy as np
+
+# Go-Explore 风格的探索档案：每个新发现的格子 (room_id, tile_x, tile_y) 保存一份内存存档，
+# reset 时可以从档案里挑一个格子继续探索，而不是每回合都从 save_file 重新走一遍开头。
+CellKey = Tuple[int, int, int]
+
+
+class Cell:
+    __slots__ = ("state", "extra", "chosen")
+
+    def __init__(self, state: bytes, extra: dict | None = None):
+        self.state = state          # pyboy.save_state 的字节内容
+        self.extra = extra or {}    # 存档时环境自身的任务状态（见 BaseEnv.cell_fields）
+        self.chosen = 0             # 被选作起点的次数
+
+
+class CellArchive:
+    """
+    有上限的格子存档集合。
+
+    - visits 记录每个格子被走到的步数（只是计数，不占多少内存，淘汰后也保留），
+      所以被淘汰的格子不会因为再次走到而重新存档；
+    - 只有首次发现的格子才会存档（pyboy.save_state 一次约几十毫秒，不能每步都做）；
+    - 选择起点时按 1 / sqrt(1 + visits + chosen) 加权，越少被访问的格子越容易被选中；
+    - 档案满了之后淘汰权重最低（访问最多）的格子。
+    """
+    def __init__(self, max_cells: int = 256):
+        self.max_cells = max_cells
+        self.cells: Dict[CellKey, Cell] = {}
+        self.visits: Dict[CellKey, int] = {}
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, key: CellKey) -> bool:
+        return key in self.cells
+
+    def visit(self, key: CellKey) -> bool:
+        """访问计数 +1，返回该格子是否第一次被发现"""
+        count = self.visits.get(key, 0)
+        self.visits[key] = count + 1
+        return count == 0
+
+    def add(self, key: CellKey, state: bytes, extra: dict | None = None):
+        if key not in self.cells and len(self.cells) >= self.max_cells:
+            self._evict()
+        self.cells[key] = Cell(state, extra)
+
+    def add_from(self, key: CellKey, pyboy, extra: dict | None = None):
+        """保存模拟器当前状态（和环境的任务状态 extra）并放进档案"""
+        buffer = io.BytesIO()
+        pyboy.save_state(buffer)
+        self.add(key, buffer.getvalue(), extra)
+
+    def _weights(self, keys) -> np.ndarray:
+        counts = np.array([self.visits.get(key, 0) + self.cells[key].chosen for key in keys], dtype=np.float64)
+        return 1.0 / np.sqrt(1.0 + counts)
+
+    def _evict(self):
+        keys = list(self.cells)
+        del self.cells[keys[int(np.argmin(self._weights(keys)))]]
+
+    def sample(self, rng: np.random.Generator) -> Tuple[CellKey, Cell]:
+        """按权重选一个格子作为起点，返回 (key, cell)"""
+        keys = list(self.cells)
+        weights = self._weights(keys)
+        key = keys[rng.choice(len(keys), p=weights / weights.sum())]
+        cell = self.cells[key]
+        cell.chosen += 1
+        return key, cell
+
+    def get(self, key: CellKey) -> Cell:
+        cell = self.cells[key]
+        cell.chosen += 1
+        return cell
+
+    def clear(self):
+        self.cells.clear()
+        self.visits.clear()
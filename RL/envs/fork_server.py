@@ -0,0 +1,200 @@
+from __future__ import annotations
+import ctypes
+import multiprocessing as mp
+import os
+import signal
+import sys
+import time
+from multiprocessing import shared_memory
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Dict, Sequence
+
+# 预启动模拟器的 fork 服务：一个干净的模板进程（spawn，不继承训练进程的 torch 线程池）
+# 导入 PyBoy 和环境模块、启动模拟器并读好存档，之后每个新环境都从这个模板 fork 出来。
+# 子进程直接继承已经启动的 PyBoy（BaseEnv 通过 take_prebooted 取用），省掉导入和启动，
+# ROM、代码段等只读页在所有子进程之间写时复制共享。
+
+# 模板进程里预启动的模拟器，按 ROM 路径索引；fork 出来的子进程各自拿到一份副本
+_PREBOOTED: Dict[str, Any] = {}
+
+
+def take_prebooted(game_file: str):
+    """取出本进程里预启动的模拟器（只能取一次），没有时返回 None"""
+    return _PREBOOTED.pop(os.path.abspath(game_file), None)
+
+
+def _boot(game_file: str, save_files: Sequence[str], preload: Sequence[str]):
+    import importlib
+    import io
+    from pyboy import PyBoy
+    from .base_env import load_state_bytes, preload_states
+
+    for module in preload:
+        importlib.import_module(module)
+    preload_states(*save_files)
+    pyboy = PyBoy(game_file, sound_emulated=False, window="null")
+    if save_files:
+        pyboy.load_state(io.BytesIO(load_state_bytes(save_files[0])))
+    pyboy.tick(1, True)
+    _PREBOOTED[os.path.abspath(game_file)] = pyboy
+
+
+def _release(obj):
+    if isinstance(obj, (list, tuple)):
+        for item in obj:
+            _release(item)
+    elif isinstance(obj, (Connection, shared_memory.SharedMemory)):
+        obj.close()
+
+
+def _serve(conn, game_file: str, save_files: Sequence[str], preload: Sequence[str]):
+    _boot(game_file, save_files, preload)
+    # 子进程退出后由内核自动回收，模板进程不需要 waitpid
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    conn.send("ready")
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if request is None:
+            break
+        target, args, result_conn = request
+        pid = os.fork()
+        if pid == 0:
+            # 子进程：恢复默认信号处理，关闭与主进程的控制管道后执行 target
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            conn.close()
+            code = 0
+            try:
+                result = target(*args)
+                if result_conn is not None:
+                    result_conn.send(result)
+            except BaseException:
+                import traceback
+
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        # 管道和共享内存已经交给子进程，模板进程里的副本要关掉（管道不关的话对端收不到 EOF）
+        _release((args, result_conn))
+        conn.send(pid)
+    for pyboy in _PREBOOTED.values():
+        pyboy.stop(save=False)
+
+
+class ForkedProcess:
+    """模板进程 fork 出来的子进程的句柄（接口与 multiprocessing.Process 的常用部分一致）"""
+    def __init__(self, server: "EmulatorForkServer", target: Callable, args: tuple = (), daemon: bool = True):
+        self.server = server
+        self.target = target
+        self.args = args
+        self.daemon = daemon  # 子进程在自己的管道断开时退出，这里只为兼容接口
+        self.pid = None
+
+    def start(self):
+        self.pid = self.server._fork(self.target, self.args)
+
+    def is_alive(self) -> bool:
+        if self.pid is None:
+            return False
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return False
+        return True
+
+    def join(self, timeout: float | None = None):
+        # 子进程不是本进程的子进程，不能 waitpid，只能轮询
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.is_alive():
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            time.sleep(0.001)
+
+    def terminate(self):
+        if self.is_alive():
+            os.kill(self.pid, signal.SIGTERM)
+
+
+class EmulatorForkServer:
+    """
+    预启动模拟器的 fork 服务。接口模仿 multiprocessing 的 context（Process / Pipe / RawArray），
+    可以直接传给 SharedMemVecEnv(fork_server=...)。
+
+    :param game_file: ROM 路径
+    :param save_files: 预先缓存的存档（第一个会直接读进模拟器）
+    :param preload: 额外预先导入的模块，例如 ["envs.env58_02"]
+    """
+    def __init__(self, game_file: str, save_files: Sequence[str] = (), preload: Sequence[str] = ()):
+        if "fork" not in mp.get_all_start_methods():
+            raise RuntimeError("EmulatorForkServer requires os.fork")
+        self._ctx = mp.get_context("spawn")
+        self._conn, child_conn = self._ctx.Pipe()
+        self.process = self._ctx.Process(
+            target=_serve, args=(child_conn, game_file, list(save_files), list(preload)), daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self._conn.recv()  # 等模板进程启动好模拟器
+        self._blocks = []
+
+    def _fork(self, target: Callable, args: tuple, result_conn=None) -> int:
+        self._conn.send((target, args, result_conn))
+        return self._conn.recv()
+
+    def Process(self, target: Callable, args: tuple = (), daemon: bool = True) -> ForkedProcess:
+        return ForkedProcess(self, target, args, daemon)
+
+    def Pipe(self, duplex: bool = True):
+        return mp.Pipe(duplex)
+
+    def RawArray(self, typecode, size: int) -> shared_memory.SharedMemory:
+        # mp 的 RawArray 只能在 spawn 时传给子进程，这里用按名字传递的 SharedMemory
+        block = shared_memory.SharedMemory(create=True, size=size * ctypes.sizeof(typecode))
+        self._blocks.append(block)
+        return block
+
+    def run(self, fn: Callable, *args) -> Any:
+        """在一个 fork 出来的子进程里执行 fn(*args) 并返回结果（例如构造一次环境读取观测空间）"""
+        recv_conn, send_conn = mp.Pipe(duplex=False)
+        self._fork(fn, args, send_conn)
+        send_conn.close()
+        try:
+            return recv_conn.recv()
+        except EOFError:
+            raise RuntimeError(f"Forked call to {fn!r} failed") from None
+        finally:
+            recv_conn.close()
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self._conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join()
+        self._conn.close()
+        self.process = None
+        # 先关闭映射再删除名字；使用方（SharedMemVecEnv.close）要先释放它在内存块上的视图
+        for block in self._blocks:
+            try:
+                block.close()
+            except BufferError:
+                print(f"Shared memory {block.name} is still in use; unlinking without closing")
+            try:
+                block.unlink()
+            except FileNotFoundError:
+                pass
+        self._blocks = []
+
+
+def _env_spaces(env_fn):
+    env = env_fn.var()
+    spaces = (env.observation_space, env.action_space)
+    env.close()
+    return spaces
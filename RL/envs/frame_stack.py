@@ -0,0 +1,40 @@
+from __future__ import annotations
+import numpy as np
+
+
+class FrameRing:
+    """
+    预分配的叠帧环形缓冲区：长度为 2k，每帧同时写到 pos 和 pos + k 两个位置，
+    这样 buffer[pos:pos + k] 总是按时间顺序（最旧 -> 最新）排好的连续切片，
+    取观测时直接返回视图，不需要拼接或拷贝。
+
+    返回的视图在下一次 push / fill 之后会被改写，需要保留时请自行 copy
+    （VecEnv 会把观测拷进自己的缓冲区，所以训练时不需要）。
+    """
+    def __init__(self, k: int, frame_shape, dtype=np.uint8):
+        if k < 1:
+            raise ValueError(f"frame stack size must be >= 1, got {k}")
+        self.k = k
+        self.buffer = np.zeros((2 * k, *frame_shape), dtype=dtype)
+        self.pos = 0  # 下一帧写入的位置，范围 [0, k)
+
+    @property
+    def shape(self):
+        return (self.k, *self.buffer.shape[1:])
+
+    def fill(self, frame: np.ndarray) -> np.ndarray:
+        """回合开始时用第一帧填满整个缓冲区"""
+        self.buffer[:] = frame
+        self.pos = 0
+        return self.view()
+
+    def push(self, frame: np.ndarray) -> np.ndarray:
+        pos, k = self.pos, self.k
+        self.buffer[pos] = frame
+        self.buffer[pos + k] = frame
+        self.pos = (pos + 1) % k
+        return self.view()
+
+    def view(self) -> np.ndarray:
+        """(k, *frame_shape) 的视图，最后一帧为最新"""
+        return self.buffer[self.pos:self.pos + self.k]
@@ -0,0 +1,140 @@
+from __future__ import annotations
+import ctypes
+import multiprocessing as mp
+import queue
+import time
+from typing import Any, Sequence
+
+import numpy as np
+
+# 集中式批量推理：一个进程持有策略，env worker 把观测写进共享内存并提交请求，
+# 服务进程把一段时间内到达的请求合成一次前向，再把动作 / 价值 / log_prob 写回共享内存。
+# 训练进程在每次 CustomPPO.train 之后把最新权重拷进服务进程的策略（refresh）。
+
+
+def _shared(ctx, shape: Sequence[int], dtype) -> Any:
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return ctx.RawArray(ctypes.c_uint8, max(nbytes, 1))
+
+
+def _view(raw, shape: Sequence[int], dtype) -> np.ndarray:
+    return np.frombuffer(raw, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+
+def _server(policy, requests, ready, buffers, shapes, max_batch: int, max_latency: float, num_threads: int):
+    import torch
+
+    torch.set_num_threads(num_threads)
+    obs_buf, action_buf, value_buf, log_prob_buf = (_view(raw, *shape) for raw, shape in zip(buffers, shapes))
+    policy.set_training_mode(False)
+    running = True
+    while running:
+        first = requests.get()
+        if first is None:
+            break
+        batch = [first]
+        # 第一个请求到达后最多再等 max_latency 秒凑批，所有客户端都到齐时立即前向
+        deadline = time.perf_counter() + max_latency
+        while len(batch) < max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                index = requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if index is None:
+                running = False
+                break
+            batch.append(index)
+
+        indices = np.asarray(batch)
+        with torch.no_grad():
+            actions, values, log_probs = policy(torch.as_tensor(obs_buf[indices]))
+        action_buf[indices] = actions.numpy().reshape(len(batch))
+        value_buf[indices] = values.numpy().reshape(len(batch))
+        log_prob_buf[indices] = log_probs.numpy().reshape(len(batch))
+        for index in batch:
+            ready[index].release()
+
+
+class InferenceClient:
+    """env worker 一侧的句柄：写入观测、提交请求、等待结果（每个客户端同时只有一个请求）"""
+    def __init__(self, index: int, requests, ready, buffers, shapes):
+        self.index = index
+        self.requests = requests
+        self.ready = ready
+        self.buffers = buffers
+        self.shapes = shapes
+        self._arrays = None
+
+    def act(self, observation) -> tuple[int, float, float]:
+        """返回 (action, value, log_prob)"""
+        if self._arrays is None:
+            self._arrays = [_view(raw, *shape) for raw, shape in zip(self.buffers, self.shapes)]
+        obs_buf, action_buf, value_buf, log_prob_buf = self._arrays
+        index = self.index
+        obs_buf[index] = observation
+        self.requests.put(index)
+        self.ready[index].acquire()
+        return int(action_buf[index]), float(value_buf[index]), float(log_prob_buf[index])
+
+
+class InferenceServer:
+    """
+    集中式策略推理服务。共享内存和队列在构造时创建（需要早于 env worker 启动），
+    服务进程在第一次 refresh 时用策略的共享内存副本启动。
+
+    :param n_clients: 客户端（env worker）数量
+    :param observation_space: 观测空间（Box）
+    :param max_latency: 凑批的最长等待时间（秒）
+    :param num_threads: 服务进程的 torch 线程数
+    """
+    def __init__(self, n_clients: int, observation_space, max_latency: float = 0.002, num_threads: int = 1):
+        self.n_clients = n_clients
+        self.max_latency = max_latency
+        self.num_threads = num_threads
+        # spawn：训练进程里已经初始化了 torch 线程池，fork 出来的子进程可能死锁
+        self._ctx = mp.get_context("spawn")
+        self._shapes = [
+            ((n_clients, *observation_space.shape), observation_space.dtype),
+            ((n_clients,), np.int64),
+            ((n_clients,), np.float32),
+            ((n_clients,), np.float32),
+        ]
+        self._buffers = [_shared(self._ctx, *shape) for shape in self._shapes]
+        self.requests = self._ctx.Queue()
+        self.ready = [self._ctx.Semaphore(0) for _ in range(n_clients)]
+        self.policy = None
+        self.process = None
+
+    def client(self, index: int) -> InferenceClient:
+        return InferenceClient(index, self.requests, self.ready, self._buffers, self._shapes)
+
+    def refresh(self, policy):
+        """把训练进程里的最新权重拷进服务进程（两次 rollout 之间调用，此时服务进程空闲）"""
+        if self.process is None:
+            self._start(policy)
+            return
+        self.policy.load_state_dict(policy.state_dict())
+
+    def _start(self, policy):
+        import copy
+
+        # CPU 上的共享内存副本：之后 load_state_dict 原地拷贝，服务进程立即看到新权重
+        self.policy = copy.deepcopy(policy).cpu()
+        self.policy.share_memory()
+        self.process = self._ctx.Process(
+            target=_server,
+            args=(self.policy, self.requests, self.ready, self._buffers, self._shapes,
+                  self.n_clients, self.max_latency, self.num_threads),
+            daemon=True,
+        )
+        self.process.start()
+
+    def close(self):
+        if self.process is None:
+            return
+        self.requests.put(None)
+        self.process.join()
+        self.process = None
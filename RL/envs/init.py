@@ -2,5 +2,9 @@ from .base_env import BaseEnv
 from .env51_01 import Room51_Task1_Env
 from .env58_02 import Room59_Task2_Env
 from .env58_01 import Room58_Task1_Env
+from .vec_env import SharedMemVecEnv, make_env
+from .multi_task import MultiTaskEnv, Task
+from .fork_server import EmulatorForkServer
+from .rollout_dataset import RolloutCapture, RolloutDataset
 
-__all__ = ["BaseEnv", "Room51_Task1_Env", "Room58_Task1_Env", "Room59_Task2_Env"]
\ No newline at end of file
+__all__ = ["BaseEnv", "Room51_Task1_Env", "Room58_Task1_Env", "Room59_Task2_Env", "SharedMemVecEnv", "make_env", "MultiTaskEnv", "Task", "EmulatorForkServer", "RolloutCapture", "RolloutDataset"]
\ No newline at end of file
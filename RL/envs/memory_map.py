@@ -0,0 +1,83 @@
+from __future__ import annotations
+import numpy as np
+from .entities import EntityTable, ENTITY_SLOTS
+
+# 内存地址（命名化，便于复用/维护）
+ADDR_CUR_HEALTH = 0xDB5A
+ADDR_MAX_HEALTH = 0xDB5B
+ADDR_RUPEE      = 0xDB5E
+ADDR_ROOM_ID    = 0xDBAE
+ADDR_KEYS       = 0xDBD0
+# Link 使用 2 号精灵，OAM 中每个精灵 4 字节：y, x, tile, attr
+ADDR_LINK_OAM_Y = 0xFE08
+ADDR_LINK_OAM_X = 0xFE09
+
+RAM_DTYPE = np.dtype([
+    ("health",     np.uint8),
+    ("max_health", np.uint8),
+    ("rupees",     np.uint8),
+    ("room",       np.uint8),
+    ("keys",       np.uint8),
+    ("link_x",     np.int16),
+    ("link_y",     np.int16),
+])
+
+# 单字节字段 -> 地址
+_BYTE_FIELDS = (
+    ("health",     ADDR_CUR_HEALTH),
+    ("max_health", ADDR_MAX_HEALTH),
+    ("rupees",     ADDR_RUPEE),
+    ("room",       ADDR_ROOM_ID),
+    ("keys",       ADDR_KEYS),
+)
+
+# RAM 观测向量（obs_mode="ram"）：Link 的状态 + 每个实体槽位的 (alive, type, x, y)，统一除以 255
+RAM_OBS_FIELDS = ("link_x", "link_y", "room", "keys", "health", "max_health")
+RAM_OBS_ENTITY_FIELDS = 4
+RAM_OBS_SIZE = len(RAM_OBS_FIELDS) + ENTITY_SLOTS * RAM_OBS_ENTITY_FIELDS
+
+
+class MemoryMap:
+    """
+    每步只访问一次模拟器内存，把用到的状态写进预分配的结构化记录 self.record，
+    之后所有辅助函数和房间环境都从这份快照读取。
+    read_entities=True 时同一次刷新也会更新实体表（self.entities）。
+    """
+    def __init__(self, read_entities: bool = False):
+        self.record = np.zeros((), dtype=RAM_DTYPE)
+        self.read_entities = read_entities
+        self.entities = EntityTable()
+
+    def update(self, pyboy):
+        memory = pyboy.memory
+        record = self.record
+        for name, addr in _BYTE_FIELDS:
+            record[name] = memory[addr]
+        # 与 pyboy.get_sprite(2) 的坐标约定一致：x - 8, y - 16
+        record["link_x"] = memory[ADDR_LINK_OAM_X] - 8
+        record["link_y"] = memory[ADDR_LINK_OAM_Y] - 16
+        if self.read_entities:
+            self.entities.update(pyboy)
+        return record
+
+    def __getitem__(self, name: str) -> int:
+        return int(self.record[name])
+
+    def observation(self, out: np.ndarray) -> np.ndarray:
+        """把当前快照写成 (RAM_OBS_SIZE,) 的 float32 观测（需要 read_entities=True）"""
+        record = self.record
+        n = len(RAM_OBS_FIELDS)
+        for i, name in enumerate(RAM_OBS_FIELDS):
+            out[i] = record[name]
+        entities = self.entities.entities
+        slots = out[n:].reshape(ENTITY_SLOTS, RAM_OBS_ENTITY_FIELDS)
+        slots[:, 0] = self.entities.alive_mask() * 255
+        slots[:, 1] = entities["type"]
+        slots[:, 2] = entities["x"]
+        slots[:, 3] = entities["y"]
+        out *= 1.0 / 255
+        return out
+
+    def snapshot(self) -> np.ndarray:
+        """返回当前记录的副本，可直接序列化（.tobytes()）用于日志和分析"""
+        return self.record.copy()
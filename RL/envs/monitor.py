@@ -0,0 +1,50 @@
+from __future__ import annotations
+import pickle
+import time
+
+from stable_baselines3.common.monitor import Monitor
+
+# make_env(monitor=True) 使用的 Monitor：只在 worker 需要回合统计时才导入（会带进 stable_baselines3 / torch）
+
+
+class SnapshotMonitor(Monitor):
+    """
+    支持断点续训的 Monitor：snapshot() 在环境快照之外带上进行中回合的奖励列表和累计统计，
+    reset(options={"snapshot": ...}) 恢复后，回合结束时的 info["episode"] 与没有中断时一致
+    （普通 Monitor.reset 会清空奖励列表，续训后每个 worker 会多记一个被截短的回合）。
+    """
+    def snapshot(self, *args, **kwargs) -> bytes:
+        return pickle.dumps({
+            "env": self.env.get_wrapper_attr("snapshot")(*args, **kwargs),
+            "monitor": {
+                "rewards": list(self.rewards),
+                "needs_reset": self.needs_reset,
+                "episode_returns": list(self.episode_returns),
+                "episode_lengths": list(self.episode_lengths),
+                "episode_times": list(self.episode_times),
+                "total_steps": self.total_steps,
+                "current_reset_info": dict(self.current_reset_info),
+                # 保存已运行的时长而不是 t_start，恢复后 info["episode"]["t"] 接着计时
+                "elapsed": time.time() - self.t_start,
+            },
+        })
+
+    def reset(self, **kwargs):
+        options = kwargs.get("options")
+        if not options or options.get("snapshot") is None:
+            return super().reset(**kwargs)
+        snapshot = pickle.loads(options["snapshot"])
+        if "monitor" not in snapshot:
+            # 没有 Monitor 状态的旧快照：按普通 reset 处理，进行中的回合从头统计
+            return super().reset(**kwargs)
+        observation, info = self.env.reset(**{**kwargs, "options": {**options, "snapshot": snapshot["env"]}})
+        state = snapshot["monitor"]
+        self.rewards = state["rewards"]
+        self.needs_reset = state["needs_reset"]
+        self.episode_returns = state["episode_returns"]
+        self.episode_lengths = state["episode_lengths"]
+        self.episode_times = state["episode_times"]
+        self.total_steps = state["total_steps"]
+        self.current_reset_info = state["current_reset_info"]
+        self.t_start = time.time() - state["elapsed"]
+        return observation, info
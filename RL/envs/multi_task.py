@@ -0,0 +1,192 @@
+from __future__ import annotations
+import pickle
+from types import MappingProxyType
+from typing import Dict, List, Mapping, NamedTuple, Sequence
+
+import numpy as np
+import gymnasium as gym
+from gymnasium.utils import seeding
+
+from .profiling import merge_timing_stats
+
+
+class Task(NamedTuple):
+    """一个训练任务：房间环境类 + 存档 + 混合权重（kwargs 为该任务额外的环境参数）"""
+    name: str
+    env_class: type
+    save_file: str
+    weight: float = 1.0
+    kwargs: Mapping = MappingProxyType({})
+
+
+def _empty_stats() -> Dict[str, float]:
+    return {"episodes": 0, "reward": 0.0, "length": 0, "goals": 0}
+
+
+class MultiTaskEnv(gym.Env):
+    """
+    在一个 worker 里混合运行多个房间任务：每个任务一个环境实例，所有实例共用同一个 PyBoy，
+    每次 reset 按 task_weights 抽一个任务并读取它的存档，所以一个进程池和一个模型就能覆盖所有任务。
+
+    info["task"] 为当前任务名；各任务的回合统计通过 pop_task_stats 取出（见 TaskStatsCallback），
+    训练中可以用 set_task_weights 调整混合比例。task_env 指向当前任务的环境，回放 / 录制按该房间记录。
+    """
+    def __init__(self, tasks: Sequence[Task], game_file: str, render_mode: str | None = None, **env_kwargs):
+        super().__init__()
+        if not tasks:
+            raise ValueError("MultiTaskEnv needs at least one task")
+        self.tasks = list(tasks)
+        self.names = [task.name for task in self.tasks]
+        self.envs = []
+        pyboy = None
+        for task in self.tasks:
+            env = task.env_class(game_file=game_file, save_file=task.save_file, render_mode=render_mode,
+                                 pyboy=pyboy, **{**env_kwargs, **task.kwargs})
+            pyboy = env.pyboy
+            self.envs.append(env)
+
+        self.observation_space = self.envs[0].observation_space
+        self.action_space = self.envs[0].action_space
+        for task, env in zip(self.tasks, self.envs):
+            if env.observation_space != self.observation_space or env.action_space != self.action_space:
+                raise ValueError(f"Task {task.name} has different spaces from {self.tasks[0].name}")
+
+        self.render_mode = render_mode
+        self.task_weights = np.array([task.weight for task in self.tasks], dtype=np.float64)
+        self.task_index = 0
+        self.env = self.envs[0]
+        self.episode_reward = 0.0
+        self.episode_length = 0
+        self._stats = {name: _empty_stats() for name in self.names}
+
+    @property
+    def task_env(self):
+        return self.env
+
+    @property
+    def task(self) -> str:
+        return self.names[self.task_index]
+
+    # 录制时需要打开渲染（obs_mode="ram"），对所有任务环境生效
+    @property
+    def render_screen(self) -> bool:
+        return self.env.render_screen
+
+    @render_screen.setter
+    def render_screen(self, value: bool):
+        for env in self.envs:
+            env.render_screen = value
+
+    @property
+    def pyboy(self):
+        return self.env.pyboy
+
+    def reset(self, seed: int | None = None, options: dict | None = None):
+        if options and options.get("snapshot") is not None:
+            observation = self.restore_snapshot(options["snapshot"])
+            info = self.env._get_info()
+            info["task"] = self.task
+            return observation, info
+        super().reset(seed=seed)
+        if seed is not None:
+            # 其他任务环境的随机数发生器也要播种，否则它们第一次被抽到时用的是未播种的发生器
+            for offset, env in enumerate(self.envs):
+                env.np_random, _ = seeding.np_random(seed + offset)
+        # options 里的 "task" 可以指定任务名，否则按权重抽样
+        if options and options.get("task") is not None:
+            self.task_index = self.names.index(options["task"])
+        else:
+            weights = self.task_weights / self.task_weights.sum()
+            self.task_index = int(self.np_random.choice(len(self.tasks), p=weights))
+        self.env = self.envs[self.task_index]
+        observation, info = self.env.reset(seed=seed, options=options)
+        self.episode_reward = 0.0
+        self.episode_length = 0
+        info["task"] = self.task
+        return observation, info
+
+    def step(self, action):
+        observation, reward, terminated, truncated, info = self.env.step(action)
+        self.episode_reward += reward
+        self.episode_length += 1
+        info["task"] = self.task
+        if terminated or truncated:
+            stats = self._stats[self.task]
+            stats["episodes"] += 1
+            stats["reward"] += self.episode_reward
+            stats["length"] += self.episode_length
+            stats["goals"] += int(info.get("goal", False))
+        return observation, reward, terminated, truncated, info
+
+    def render(self):
+        return self.env.render()
+
+    def snapshot(self) -> bytes:
+        """所有任务环境的快照（见 BaseEnv.snapshot，模拟器只随当前任务保存一次）+ 任务选择与回合统计"""
+        return pickle.dumps({
+            "task_index": self.task_index,
+            "task_weights": self.task_weights,
+            "episode_reward": self.episode_reward,
+            "episode_length": self.episode_length,
+            "stats": self._stats,
+            "np_random": self._np_random,
+            "envs": [env.snapshot(emulator=env is self.env) for env in self.envs],
+        })
+
+    def restore_snapshot(self, data: bytes) -> np.ndarray:
+        snapshot = pickle.loads(data)
+        self.task_index = snapshot["task_index"]
+        self.task_weights = snapshot["task_weights"]
+        self.episode_reward = snapshot["episode_reward"]
+        self.episode_length = snapshot["episode_length"]
+        self._stats = snapshot["stats"]
+        self._np_random = snapshot["np_random"]
+        self.env = self.envs[self.task_index]
+        for env, env_snapshot in zip(self.envs, snapshot["envs"]):
+            if env is not self.env:
+                env.restore_snapshot(env_snapshot)
+        # 当前任务最后恢复：它带着共用模拟器的存档
+        return self.env.restore_snapshot(snapshot["envs"][self.task_index])
+
+    def close(self):
+        # 所有任务共用一个模拟器，只需要关闭一次
+        self.envs[0].close()
+
+    def set_task_weights(self, weights):
+        """weights 为按任务顺序的序列，或 {任务名: 权重}（未列出的任务保持不变）"""
+        if isinstance(weights, dict):
+            for name, weight in weights.items():
+                self.task_weights[self.names.index(name)] = weight
+        else:
+            self.task_weights[:] = weights
+        if self.task_weights.sum() <= 0:
+            raise ValueError("Task weights must not all be zero")
+
+    def pop_task_stats(self) -> Dict[str, Dict[str, float]]:
+        """返回上次调用之后各任务的回合统计并清零"""
+        stats = self._stats
+        self._stats = {name: _empty_stats() for name in self.names}
+        return stats
+
+    def get_timing_stats(self, window: bool = False):
+        return merge_timing_stats([env.get_timing_stats(window) for env in self.envs]) if self.env.timer else None
+
+
+def merge_task_stats(stats_list: List[Dict[str, Dict[str, float]]]) -> Dict[str, Dict[str, float]]:
+    """合并多个 worker 的 pop_task_stats 结果"""
+    merged: Dict[str, Dict[str, float]] = {}
+    for stats in stats_list:
+        for name, task_stats in stats.items():
+            total = merged.setdefault(name, _empty_stats())
+            for key, value in task_stats.items():
+                total[key] += value
+    return merged
+
+
+def success_weights(stats: Dict[str, Dict[str, float]], floor: float = 0.1) -> Dict[str, float] | None:
+    """按完成率重新分配权重：完成率越低的任务越常被抽到（至少保留 floor）"""
+    weights = {}
+    for name, task_stats in stats.items():
+        if task_stats["episodes"] > 0:
+            weights[name] = max(floor, 1.0 - task_stats["goals"] / task_stats["episodes"])
+    return weights or None
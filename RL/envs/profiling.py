@@ -0,0 +1,70 @@
+from __future__ import annotations
+import time
+from typing import Dict
+
+# BaseEnv.step / reset 中计时的阶段
+PHASES = ("reset", "emulate", "ram", "step_extra", "reward", "archive", "obs", "info")
+
+
+class StepTimer:
+    """
+    累计 BaseEnv 各阶段的耗时（秒）和模拟帧数：
+    episode 为当前回合，window 为上次 pop_window 之后，total 为整个生命周期（不含当前回合）。
+    只在 BaseEnv(profile=True) 时创建；关闭时 step 里只剩几次 `if timer` 判断。
+    """
+    def __init__(self):
+        self.total = self._empty()
+        self.episode = self._empty()
+        self.window = self._empty()
+        self._last = 0.0
+
+    @staticmethod
+    def _empty() -> Dict[str, float]:
+        stats = dict.fromkeys(PHASES, 0.0)
+        stats["steps"] = 0
+        stats["frames"] = 0
+        return stats
+
+    def start(self):
+        self._last = time.perf_counter()
+
+    def lap(self, phase: str):
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self.episode[phase] += elapsed
+        self.window[phase] += elapsed
+        self._last = now
+
+    def end_step(self, frames: int):
+        for stats in (self.episode, self.window):
+            stats["steps"] += 1
+            stats["frames"] += frames
+
+    def end_episode(self) -> Dict[str, float]:
+        """把本回合统计并入总计并返回本回合的统计"""
+        episode = self.episode
+        for key, value in episode.items():
+            self.total[key] += value
+        self.episode = self._empty()
+        return episode
+
+    def summary(self) -> Dict[str, float]:
+        """整个生命周期的总计（包含尚未结束的回合）"""
+        return {key: self.total[key] + self.episode[key] for key in self.total}
+
+    def pop_window(self) -> Dict[str, float]:
+        """返回上次调用之后的增量并清零，便于回调按 rollout 统计"""
+        window = self.window
+        self.window = self._empty()
+        return window
+
+
+def merge_timing_stats(stats_list) -> Dict[str, float]:
+    """合并多个环境的统计（例如 vec_env.env_method("get_timing_stats") 的返回值）"""
+    merged = StepTimer._empty()
+    for stats in stats_list:
+        if not stats:
+            continue
+        for key in merged:
+            merged[key] += stats.get(key, 0)
+    return merged
@@ -0,0 +1,172 @@
+from __future__ import annotations
+import hashlib
+import importlib
+import json
+import os
+import warnings
+from typing import Iterator, Tuple
+
+import numpy as np
+import gymnasium as gym
+
+from .base_env import load_state_bytes
+
+# 回放文件：一个存档引用 + 每步的动作索引（BaseEnv.valid_actions 的下标）。
+# PyBoy 在给定存档和输入序列时是确定性的，所以任意帧都可以重新模拟出来。
+# 回合从探索档案的格子开始时（没有对应的存档文件），存档字节直接内嵌在回放文件里。
+REPLAY_VERSION = 2
+
+
+def _state_sha1(data: bytes) -> str:
+    return hashlib.sha1(data).hexdigest()
+
+
+class Replay:
+    def __init__(self, actions, meta: dict, state: bytes | None = None):
+        self.actions = np.asarray(actions, dtype=np.uint8)
+        self.meta = meta
+        self.state = state  # 内嵌的起点存档，为空时使用 meta["save_file"]
+
+    def __len__(self):
+        return len(self.actions)
+
+    @classmethod
+    def from_env(cls, env, actions) -> "Replay":
+        base = env.unwrapped.task_env
+        env_class = type(base)
+        # loaded_state 为 None 说明起点是档案格子，需要内嵌存档
+        state = base.loaded_state_data if base.loaded_state is None else None
+        meta = {
+            "version": REPLAY_VERSION,
+            "env_class": f"{env_class.__module__}:{env_class.__qualname__}",
+            "game_file": base.game_file,
+            "save_file": base.loaded_state or base.save_file,
+            "state_sha1": _state_sha1(base.loaded_state_data),
+            "start_cell": list(base.start_cell) if base.start_cell is not None else None,
+            "goal_room": base.goal_room,
+            "press_frames": base.press_frames,
+            "release_frames": base.release_frames,
+            "obs_mode": base.obs_mode,
+            "frame_stack": base.frames.k if base.frames is not None else 1,
+        }
+        return cls(actions, meta, state)
+
+    def save(self, path: str) -> str:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        arrays = {"actions": self.actions, "meta": np.array(json.dumps(self.meta))}
+        if self.state is not None:
+            arrays["state"] = np.frombuffer(self.state, dtype=np.uint8)
+        np.savez_compressed(path, **arrays)
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "Replay":
+        with np.load(path, allow_pickle=False) as data:
+            state = data["state"].tobytes() if "state" in data.files else None
+            return cls(data["actions"], json.loads(str(data["meta"])), state)
+
+    def make_env(self, env_class=None, **overrides):
+        """按记录的参数构造一个无窗口环境；env_class 为空时按记录的模块路径导入"""
+        if env_class is None:
+            module_name, class_name = self.meta["env_class"].split(":")
+            env_class = getattr(importlib.import_module(module_name), class_name)
+        kwargs = {
+            "game_file": self.meta["game_file"],
+            "save_file": self.meta["save_file"],
+            "goal_room": self.meta["goal_room"],
+            "press_frames": self.meta["press_frames"],
+            "release_frames": self.meta["release_frames"],
+            "obs_mode": self.meta.get("obs_mode", "screen"),
+            "frame_stack": self.meta.get("frame_stack", 1),
+        }
+        kwargs.update(overrides)
+        return env_class(**kwargs)
+
+    def run(self, env=None, stop: int | None = None, render: bool = False) -> Iterator[Tuple[int, "gym.Env"]]:
+        """
+        重新模拟整段回放，每步之后 yield (step, env)，调用方按需读取画面 / 观测 / 内存。
+        step 为 0 时对应 reset 之后的初始状态。
+        render=True 时强制渲染画面（obs_mode="ram" 训练时不渲染，回放时需要打开）。
+        """
+        if self.state is not None:
+            options = {"state": self.state}
+        else:
+            options = {"save_file": self.meta["save_file"]}
+            if _state_sha1(load_state_bytes(self.meta["save_file"])) != self.meta["state_sha1"]:
+                warnings.warn(f"Savestate {self.meta['save_file']} changed since the replay was recorded")
+        own_env = env is None
+        if own_env:
+            env = self.make_env()
+        if render:
+            env.unwrapped.render_screen = True
+        try:
+            env.reset(options=options)
+            yield 0, env
+            stop = len(self.actions) if stop is None else min(stop, len(self.actions))
+            for step in range(stop):
+                env.step(int(self.actions[step]))
+                yield step + 1, env
+        finally:
+            if own_env:
+                env.close()
+
+    def frames(self, start: int = 0, stop: int | None = None) -> np.ndarray:
+        """返回 [start, stop] 范围内每步的 RGBA 画面，形状 (n, 144, 160, 4)"""
+        return np.stack([env.unwrapped.pyboy.screen.ndarray.copy() for step, env in self.run(stop=stop, render=True) if step >= start])
+
+    def observations(self, start: int = 0, stop: int | None = None) -> np.ndarray:
+        """返回 [start, stop] 范围内每步的观测"""
+        # 叠帧时 _get_obs 返回环形缓冲区的视图，逐步拷贝出来
+        return np.stack([env.unwrapped._get_obs().copy() for step, env in self.run(stop=stop) if step >= start])
+
+    def to_gif(self, path: str, start: int = 0, stop: int | None = None, fps: int = 30) -> str:
+        import imageio
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with imageio.get_writer(path, mode="I", duration=1000 / fps, loop=0) as writer:
+            for step, env in self.run(stop=stop, render=True):
+                if step >= start:
+                    writer.append_data(env.unwrapped.pyboy.screen.ndarray)
+        return path
+
+
+class ReplayRecorder(gym.Wrapper):
+    """
+    记录每个回合的存档和动作序列，回合结束时写出回放文件（几 KB），
+    文件路径放在最后一步的 info["replay_file"] 里。
+    """
+    def __init__(self, env: gym.Env, save_dir: str, name_prefix: str = "episode"):
+        super().__init__(env)
+        self.save_dir = save_dir
+        self.name_prefix = name_prefix
+        self.actions = []
+        self.replay = None
+        self.last_replay_file = None
+
+    def reset(self, **kwargs):
+        self._save()
+        obs, info = self.env.reset(**kwargs)
+        self.actions = []
+        self.replay = Replay.from_env(self.env, [])
+        return obs, info
+
+    def step(self, action):
+        self.actions.append(int(action))
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        if terminated or truncated:
+            info["replay_file"] = self._save()
+        return obs, reward, terminated, truncated, info
+
+    def close(self):
+        self._save()
+        super().close()
+
+    def _save(self) -> str | None:
+        if self.replay is None or not self.actions:
+            return None
+        self.replay.actions = np.asarray(self.actions, dtype=np.uint8)
+        episode = self.env.unwrapped.task_env.episode
+        path = os.path.join(self.save_dir, f"{self.name_prefix}_{episode:06d}.npz")
+        self.last_replay_file = self.replay.save(path)
+        self.replay = None
+        return self.last_replay_file
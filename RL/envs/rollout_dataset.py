@@ -0,0 +1,184 @@
+from __future__ import annotations
+import glob
+import json
+import os
+from typing import Iterator, List
+
+import numpy as np
+import gymnasium as gym
+
+from .memory_map import RAM_DTYPE
+
+# 离线数据集：把训练时采到的每一步 (obs, action, reward, terminated, truncated, ram) 追加写进
+# 内存映射的 .npy 分片（每个分片是一个结构化数组），目录下的 index.json 记录写完的分片和行数。
+# 同一个目录里的行按时间顺序排列：没有 terminated / truncated 的行，下一行的 obs 就是它的下一个观测。
+DATASET_VERSION = 1
+INDEX_FILE = "index.json"
+
+
+def record_dtype(observation_space: gym.spaces.Box) -> np.dtype:
+    """一行记录：动作之前的观测、动作、奖励、终止 / 截断、动作之前的内存快照（MemoryMap.record）"""
+    return np.dtype([
+        ("obs", observation_space.dtype, observation_space.shape),
+        ("action", np.int16),
+        ("reward", np.float32),
+        ("terminated", np.bool_),
+        ("truncated", np.bool_),
+        ("ram", RAM_DTYPE),
+    ])
+
+
+def _read_index(path: str) -> dict | None:
+    index_path = os.path.join(path, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path) as f:
+        return json.load(f)
+
+
+class DatasetWriter:
+    """
+    追加写入一个目录的分片。只有当前分片被映射在内存里，写满后 flush 并登记进 index.json，
+    所以内存占用与总数据量无关；进程中断时只会丢掉还没写满的最后一个分片。
+
+    :param path: 数据目录（已有数据时接着追加）
+    :param dtype: 行的结构化 dtype，见 record_dtype
+    :param shard_size: 每个分片的行数
+    """
+    def __init__(self, path: str, dtype: np.dtype, shard_size: int = 16384):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.shard_size = shard_size
+        self.index = _read_index(path)
+        if self.index is None:
+            self.index = {"version": DATASET_VERSION, "dtype": str(self.dtype.descr), "shards": []}
+        elif self.index["dtype"] != str(self.dtype.descr):
+            raise ValueError(f"Dataset in {path} has a different record layout")
+        self.shard = None
+        self.length = 0
+
+    def _open_shard(self):
+        self.shard_file = f"shard_{len(self.index['shards']):05d}.npy"
+        self.shard = np.lib.format.open_memmap(
+            os.path.join(self.path, self.shard_file), mode="w+", dtype=self.dtype, shape=(self.shard_size,)
+        )
+        # 每个字段缓存一个普通 ndarray 视图，append 时直接按下标写
+        rows = self.shard.view(np.ndarray)
+        self._fields = [rows[name] for name in self.dtype.names]
+        self.length = 0
+
+    def _close_shard(self):
+        self.shard.flush()
+        self.shard = None
+        self._fields = None
+        if self.length == 0:
+            os.remove(os.path.join(self.path, self.shard_file))
+            return
+        self.index["shards"].append({"file": self.shard_file, "length": self.length})
+        # 先写临时文件再替换，index.json 总是完整的
+        tmp_path = os.path.join(self.path, INDEX_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.path, INDEX_FILE))
+
+    def append(self, *values):
+        """按 dtype 的字段顺序写入一行"""
+        if self.shard is None:
+            self._open_shard()
+        i = self.length
+        for field, value in zip(self._fields, values):
+            field[i] = value
+        self.length = i + 1
+        if self.length == self.shard_size:
+            self._close_shard()
+
+    def close(self):
+        if self.shard is not None:
+            self._close_shard()
+
+
+class RolloutCapture(gym.Wrapper):
+    """
+    把环境的每一步追加写进 DatasetWriter（见 record_dtype），对 step 只多几次内存拷贝。
+    一般通过 make_env(..., capture_dir=...) 使用，每个 worker 写自己的子目录。
+
+    :param env: BaseEnv（或 MultiTaskEnv），unwrapped.task_env.ram 为内存快照
+    :param path: 数据目录
+    :param shard_size: 每个分片的行数
+    """
+    def __init__(self, env: gym.Env, path: str, shard_size: int = 16384):
+        super().__init__(env)
+        self.writer = DatasetWriter(path, record_dtype(env.observation_space), shard_size=shard_size)
+        # 动作之前的观测和内存快照（叠帧时观测是环形缓冲区的视图，必须拷贝）
+        self._obs = np.zeros(env.observation_space.shape, dtype=env.observation_space.dtype)
+        self._ram = np.zeros((), dtype=RAM_DTYPE)
+
+    def _remember(self, observation):
+        np.copyto(self._obs, observation)
+        self._ram[()] = self.env.unwrapped.task_env.ram.record
+
+    def reset(self, **kwargs):
+        observation, info = self.env.reset(**kwargs)
+        self._remember(observation)
+        return observation, info
+
+    def step(self, action):
+        observation, reward, terminated, truncated, info = self.env.step(action)
+        self.writer.append(self._obs, action, reward, terminated, truncated, self._ram)
+        self._remember(observation)
+        return observation, reward, terminated, truncated, info
+
+    def close(self):
+        self.writer.close()
+        self.env.close()
+
+
+class RolloutDataset:
+    """
+    只读加载 path 下（递归）所有 index.json 登记的分片。分片以 mmap_mode="r" 打开，
+    shards / field() 返回的都是映射视图，不拷贝数据；sample / batches 只拷贝抽到的行。
+    """
+    def __init__(self, path: str):
+        self.shards: List[np.ndarray] = []
+        for index_path in sorted(glob.glob(os.path.join(path, "**", INDEX_FILE), recursive=True)):
+            directory = os.path.dirname(index_path)
+            for shard in _read_index(directory)["shards"]:
+                rows = np.load(os.path.join(directory, shard["file"]), mmap_mode="r")
+                self.shards.append(rows[:shard["length"]])
+        if not self.shards:
+            raise FileNotFoundError(f"No rollout shards found under {path}")
+        self.dtype = self.shards[0].dtype
+        self.offsets = np.cumsum([0] + [len(rows) for rows in self.shards])
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def __getitem__(self, index: int) -> np.void:
+        shard = int(np.searchsorted(self.offsets, index, side="right")) - 1
+        return self.shards[shard][index - self.offsets[shard]]
+
+    def field(self, name: str) -> List[np.ndarray]:
+        """某个字段在每个分片里的视图（例如 field("action")）"""
+        return [rows[name] for rows in self.shards]
+
+    def gather(self, indices: np.ndarray) -> np.ndarray:
+        """按全局行号取出若干行（结构化数组，拷贝）"""
+        indices = np.asarray(indices)
+        out = np.empty(len(indices), dtype=self.dtype)
+        shard_ids = np.searchsorted(self.offsets, indices, side="right") - 1
+        for shard in np.unique(shard_ids):
+            mask = shard_ids == shard
+            out[mask] = self.shards[shard][indices[mask] - self.offsets[shard]]
+        return out
+
+    def sample(self, batch_size: int, rng: np.random.Generator | None = None) -> np.ndarray:
+        rng = rng or np.random.default_rng()
+        return self.gather(rng.integers(0, len(self), batch_size))
+
+    def batches(self, batch_size: int, shuffle: bool = True,
+                rng: np.random.Generator | None = None) -> Iterator[np.ndarray]:
+        """遍历一遍数据集（打乱时每个 batch 随机取行）"""
+        order = (rng or np.random.default_rng()).permutation(len(self)) if shuffle else np.arange(len(self))
+        for start in range(0, len(order), batch_size):
+            yield self.gather(order[start:start + batch_size])
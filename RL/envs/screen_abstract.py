@@ -1,20 +1,85 @@
-import torch
-import torch.nn as nn
-import torch.nn.functional as F
+from __future__ import annotations
 import numpy as np
 
-def create_gaussian_kernel(size, sigma):
-    """生成一个高斯核"""
+def create_gaussian_weights(size, sigma):
+    """一维高斯权重（归一化）；二维高斯核可分离，等于 np.outer(weights, weights)"""
     ax = np.arange(-size // 2 + 1., size // 2 + 1.)
-    xx, yy = np.meshgrid(ax, ax)
-    kernel = np.exp(-(xx**2 + yy**2) / (2. * sigma**2))
-    return kernel / kernel.sum()
-
-# 定义 16x16 的高斯核
-gaussian_kernel = torch.tensor(create_gaussian_kernel(16, sigma=4), dtype=torch.float32)
-
-def gamearea_abstract(gamescreen):
-    reshaped = gamescreen.unfold(0, 16, 16).unfold(1, 16, 16)
-    pooled = (reshaped * gaussian_kernel).sum(dim=(-1, -2))
-    pooled_int8 = pooled.clamp(0, 255).to(torch.uint8)
-    return pooled_int8
\ No newline at end of file
+    weights = np.exp(-ax**2 / (2. * sigma**2))
+    return weights / weights.sum()
+
+
+class ScreenPooler:
+    """
+    对屏幕做不重叠的 size x size 高斯池化（与 gamearea_abstract 等价）。
+    高斯核可分离，所以池化等价于 left @ screen @ right 两次小矩阵乘法，
+    中间结果和输出都预先分配好，每次调用不再申请内存。
+    pool_batch 对 (N, H, W) 的一叠屏幕一次性完成池化。
+    """
+    def __init__(self, height: int = 128, width: int = 160, size: int = 16, sigma: float = 4):
+        if height % size or width % size:
+            raise ValueError(f"screen {height}x{width} is not divisible by kernel size {size}")
+        self.height, self.width, self.size = height, width, size
+        weights = create_gaussian_weights(size, sigma).astype(np.float32)
+        out_h, out_w = height // size, width // size
+        # left[i, size*i + a] = w[a]；right[size*j + b, j] = w[b]
+        self.left = np.kron(np.eye(out_h, dtype=np.float32), weights[None, :])
+        self.right = np.kron(np.eye(out_w, dtype=np.float32), weights[:, None])
+
+        self._screen = np.empty((height, width), dtype=np.float32)
+        self._rows = np.empty((out_h, width), dtype=np.float32)
+        self._pooled = np.empty((out_h, out_w), dtype=np.float32)
+        self.out = np.empty((out_h, out_w), dtype=np.uint8)
+        self._batch_buffers = {}
+
+    @property
+    def shape(self):
+        return self.out.shape
+
+    def __call__(self, screen: np.ndarray) -> np.ndarray:
+        """screen 可以是 pyboy.screen.ndarray 的切片视图；返回值是内部复用的 uint8 缓冲区"""
+        np.copyto(self._screen, screen[:self.height, :self.width], casting="unsafe")
+        np.matmul(self.left, self._screen, out=self._rows)
+        np.matmul(self._rows, self.right, out=self._pooled)
+        np.clip(self._pooled, 0, 255, out=self._pooled)
+        np.copyto(self.out, self._pooled, casting="unsafe")
+        return self.out
+
+    def pool_batch(self, screens: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+        """screens: (N, H, W)，例如从共享内存里取出的多个环境的屏幕；返回 (N, H/size, W/size) 的 uint8"""
+        n = screens.shape[0]
+        buffers = self._batch_buffers.get(n)
+        if buffers is None:
+            out_h, out_w = self.out.shape
+            buffers = self._batch_buffers[n] = (
+                np.empty((n, self.height, self.width), dtype=np.float32),
+                np.empty((n, out_h, self.width), dtype=np.float32),
+                np.empty((n, out_h, out_w), dtype=np.float32),
+            )
+        screen_f, rows, pooled = buffers
+        if out is None:
+            out = np.empty(pooled.shape, dtype=np.uint8)
+        np.copyto(screen_f, screens[:, :self.height, :self.width], casting="unsafe")
+        np.matmul(self.left, screen_f, out=rows)
+        np.matmul(rows, self.right, out=pooled)
+        np.clip(pooled, 0, 255, out=pooled)
+        np.copyto(out, pooled, casting="unsafe")
+        return out
+
+
+_poolers = {}
+
+def _get_pooler(height, width, size, sigma) -> ScreenPooler:
+    key = (height, width, size, sigma)
+    pooler = _poolers.get(key)
+    if pooler is None:
+        pooler = _poolers[key] = ScreenPooler(height, width, size=size, sigma=sigma)
+    return pooler
+
+def gamearea_abstract(gamescreen, size=16, sigma=4):
+    gamescreen = np.asarray(gamescreen)
+    return _get_pooler(*gamescreen.shape, size, sigma)(gamescreen).copy()
+
+def gamearea_abstract_batch(gamescreens, size=16, sigma=4, out=None):
+    """批量版本：(N, H, W) -> (N, H/size, W/size)，一次向量化调用完成所有环境的池化"""
+    gamescreens = np.asarray(gamescreens)
+    return _get_pooler(*gamescreens.shape[1:], size, sigma).pool_batch(gamescreens, out=out)
@@ -0,0 +1,194 @@
+from __future__ import annotations
+import multiprocessing as mp
+from typing import Any, Callable, List, Sequence
+
+import numpy as np
+import gymnasium as gym
+from gymnasium import spaces
+from stable_baselines3.common.vec_env.base_vec_env import (
+    VecEnv,
+    VecEnvIndices,
+    VecEnvObs,
+    VecEnvStepReturn,
+)
+
+# worker 端的实现放在 vec_worker.py（不依赖 SB3），这里只保留主进程一侧的 VecEnv
+from .vec_worker import CloudpickleWrapper, make_env, _shared_array, _as_ndarray, _worker
+from .fork_server import _env_spaces
+
+
+class SharedMemVecEnv(VecEnv):
+    """
+    多进程向量化环境：每个 worker 进程持有自己的 PyBoy，
+    观测 / 奖励 / done 直接写入共享内存，管道里只传动作和 info 字典。
+
+    :param env_fns: 构造环境的函数列表（一个函数对应一个 worker），可用 make_env 生成
+    :param start_method: 进程启动方式，默认在支持的平台上使用 fork
+        （fork 可以让 worker 直接继承主进程里已经缓存的资源）
+    :param rollout_steps: >0 时开启集中式推理：创建 InferenceServer，worker 通过 collect()
+        自行采样 rollout_steps 步，动作由推理服务批量计算（CustomPPO 会自动使用）
+    :param max_latency: 推理服务凑批的最长等待时间（秒）
+    :param fork_server: EmulatorForkServer；给出时 worker 从预启动模拟器的模板进程 fork 出来，
+        主进程里不再构造环境（与 rollout_steps 不能同时使用）
+    """
+
+    def __init__(self, env_fns: List[Callable[[], gym.Env]], start_method: str | None = None,
+                 rollout_steps: int = 0, max_latency: float = 0.002, fork_server=None):
+        self.waiting = False
+        self.closed = False
+        n_envs = len(env_fns)
+
+        # 先构造一次环境拿到空间信息，用来分配共享内存（有 fork 服务时在 fork 出来的子进程里构造）
+        if fork_server is not None:
+            if rollout_steps > 0:
+                raise ValueError("fork_server cannot be combined with rollout_steps")
+            observation_space, action_space = fork_server.run(_env_spaces, CloudpickleWrapper(env_fns[0]))
+        else:
+            probe = env_fns[0]()
+            observation_space, action_space = probe.observation_space, probe.action_space
+            probe.close()
+        if not isinstance(observation_space, spaces.Box):
+            raise ValueError(f"SharedMemVecEnv only supports Box observation spaces, got {type(observation_space)}")
+        super().__init__(n_envs, observation_space, action_space)
+
+        if fork_server is not None:
+            ctx = fork_server
+        else:
+            if start_method is None:
+                start_method = "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+            ctx = mp.get_context(start_method)
+
+        self._shapes = [
+            ((n_envs, *observation_space.shape), observation_space.dtype),
+            ((n_envs,), np.float32),
+            ((n_envs,), np.bool_),
+        ]
+        self._buffers = [_shared_array(ctx, shape, dtype) for shape, dtype in self._shapes]
+        self.buf_obs, self.buf_rews, self.buf_dones = (
+            _as_ndarray(raw, shape, dtype) for raw, (shape, dtype) in zip(self._buffers, self._shapes)
+        )
+
+        # 集中式推理：rollout 数组按 (step, env) 排列，与 RolloutBuffer 的布局一致
+        self.inference = None
+        self.rollout_steps = rollout_steps
+        if rollout_steps > 0:
+            from .inference_server import InferenceServer
+
+            self.inference = InferenceServer(n_envs, observation_space, max_latency=max_latency)
+            self._rollout_shapes = [
+                ((rollout_steps, n_envs, *observation_space.shape), observation_space.dtype),
+                ((rollout_steps, n_envs), np.int64),
+                ((rollout_steps, n_envs), np.float32),
+                ((rollout_steps, n_envs), np.bool_),
+                ((rollout_steps, n_envs), np.float32),
+                ((rollout_steps, n_envs), np.float32),
+            ]
+            self._rollout_buffers = [_shared_array(ctx, shape, dtype) for shape, dtype in self._rollout_shapes]
+            self.rollout = dict(zip(
+                ("observations", "actions", "rewards", "episode_starts", "values", "log_probs"),
+                (_as_ndarray(raw, shape, dtype) for raw, (shape, dtype) in zip(self._rollout_buffers, self._rollout_shapes)),
+            ))
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_envs)])
+        self.processes = []
+        for index, (work_remote, remote, env_fn) in enumerate(zip(self.work_remotes, self.remotes, env_fns)):
+            args = (work_remote, remote, CloudpickleWrapper(env_fn), self._buffers, self._shapes, index)
+            if self.inference is not None:
+                args += ((self.inference.client(index), self._rollout_buffers, self._rollout_shapes),)
+            # daemon=True：主进程崩溃时 worker 随之退出
+            process = ctx.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+    def step_async(self, actions: np.ndarray) -> None:
+        for remote, action in zip(self.remotes, actions):
+            remote.send(("step", action))
+        self.waiting = True
+
+    def step_wait(self) -> VecEnvStepReturn:
+        results = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        infos, self.reset_infos = zip(*results)
+        return self.buf_obs.copy(), self.buf_rews.copy(), self.buf_dones.copy(), list(infos)
+
+    def reset(self) -> VecEnvObs:
+        for env_idx, remote in enumerate(self.remotes):
+            remote.send(("reset", (self._seeds[env_idx], self._options[env_idx])))
+        self.reset_infos = [remote.recv() for remote in self.remotes]
+        self._reset_seeds()
+        self._reset_options()
+        return self.buf_obs.copy()
+
+    def collect(self, policy, n_steps: int, gamma: float) -> List[dict]:
+        """
+        用推理服务采样 n_steps 步（需要先 reset），结果在 self.rollout 里，
+        最后的观测 / done 在 buf_obs / buf_dones 里。返回本次结束的回合的 info 列表。
+        """
+        if self.inference is None:
+            raise RuntimeError("SharedMemVecEnv was created without rollout_steps")
+        if n_steps > self.rollout_steps:
+            raise ValueError(f"n_steps={n_steps} exceeds rollout_steps={self.rollout_steps}")
+        self.inference.refresh(policy)
+        for remote in self.remotes:
+            remote.send(("rollout", (n_steps, gamma)))
+        episode_infos = []
+        for remote in self.remotes:
+            episode_infos.extend(remote.recv())
+        return episode_infos
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        if self.inference is not None:
+            self.inference.close()
+        # 释放共享内存上的 numpy 视图，之后 EmulatorForkServer.close 才能关闭这些内存块
+        self.buf_obs = self.buf_rews = self.buf_dones = None
+        self.rollout = None
+        self.closed = True
+
+    def get_images(self) -> Sequence[np.ndarray | None]:
+        for remote in self.remotes:
+            remote.send(("render", None))
+        return [remote.recv() for remote in self.remotes]
+
+    def has_attr(self, attr_name: str) -> bool:
+        target_remotes = self._get_target_remotes(None)
+        for remote in target_remotes:
+            remote.send(("has_attr", attr_name))
+        return all([remote.recv() for remote in target_remotes])
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> List[Any]:
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(("get_attr", attr_name))
+        return [remote.recv() for remote in target_remotes]
+
+    def set_attr(self, attr_name: str, value: Any, indices: VecEnvIndices = None) -> None:
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(("set_attr", (attr_name, value)))
+        for remote in target_remotes:
+            remote.recv()
+
+    def env_method(self, method_name: str, *method_args, indices: VecEnvIndices = None, **method_kwargs) -> List[Any]:
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(("env_method", (method_name, method_args, method_kwargs)))
+        return [remote.recv() for remote in target_remotes]
+
+    def env_is_wrapped(self, wrapper_class, indices: VecEnvIndices = None) -> List[bool]:
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(("is_wrapped", wrapper_class))
+        return [remote.recv() for remote in target_remotes]
+
+    def _get_target_remotes(self, indices: VecEnvIndices) -> List[Any]:
+        return [self.remotes[i] for i in self._get_indices(indices)]
@@ -0,0 +1,158 @@
+from __future__ import annotations
+import ctypes
+import os
+from typing import Any, Callable, Sequence
+
+import numpy as np
+import gymnasium as gym
+
+# SharedMemVecEnv 的 worker 端：只依赖 numpy / gymnasium，不导入 stable_baselines3 / torch，
+# 用 spawn 启动的 worker 或者短命的评估 / 录制进程只需要为模拟器本身付出导入时间。
+
+
+class CloudpickleWrapper:
+    """用 cloudpickle 序列化构造环境的闭包（与 SB3 的同名类相同，但不需要导入 SB3）"""
+    def __init__(self, var: Any):
+        self.var = var
+
+    def __getstate__(self) -> Any:
+        import cloudpickle
+
+        return cloudpickle.dumps(self.var)
+
+    def __setstate__(self, var: Any) -> None:
+        import cloudpickle
+
+        self.var = cloudpickle.loads(var)
+
+
+def make_env(env_class, rank: int = 0, seed: int | None = None, monitor: bool = True,
+             capture_dir: str | None = None, **env_kwargs) -> Callable[[], gym.Env]:
+    """
+    返回一个在 worker 进程内构造环境的函数。
+    monitor=True 时套上 SB3 的 Monitor 统计回合奖励（会在 worker 里导入 stable_baselines3 / torch），
+    用的是 monitor.SnapshotMonitor，断点续训时进行中回合的统计随环境快照一起保存。
+    capture_dir 不为空时把每一步写进 capture_dir/env_<rank> 下的离线数据集（见 rollout_dataset.py）。
+    """
+    def _init() -> gym.Env:
+        env = env_class(**env_kwargs)
+        if capture_dir is not None:
+            from .rollout_dataset import RolloutCapture
+
+            env = RolloutCapture(env, os.path.join(capture_dir, f"env_{rank}"))
+        if monitor:
+            from .monitor import SnapshotMonitor
+
+            env = SnapshotMonitor(env)
+        if seed is not None:
+            env.reset(seed=seed + rank)
+        return env
+    return _init
+
+
+def _shared_array(ctx, shape: Sequence[int], dtype) -> Any:
+    # RawArray 不带锁：每个 worker 只写自己的那一行，主进程在收到 ack 之后才读
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return ctx.RawArray(ctypes.c_uint8, max(nbytes, 1))
+
+
+def _as_ndarray(raw, shape: Sequence[int], dtype) -> np.ndarray:
+    # raw 为 RawArray，或 EmulatorForkServer 分配的 SharedMemory
+    return np.frombuffer(getattr(raw, "buf", raw), dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+
+def _collect(env, client, arrays, index: int, observation, episode_start: bool, n_steps: int, gamma: float):
+    """
+    worker 内的 rollout：每步向推理服务请求动作，结果写进共享的 rollout 数组 [step, index]。
+    截断（超时）的回合用终止帧的价值做 bootstrap，与 SB3 的 collect_rollouts 一致。
+    """
+    obs_arr, action_arr, reward_arr, start_arr, value_arr, log_prob_arr = arrays
+    episode_infos = []
+    for step in range(n_steps):
+        action, value, log_prob = client.act(observation)
+        obs_arr[step, index] = observation
+        start_arr[step, index] = episode_start
+        action_arr[step, index] = action
+        value_arr[step, index] = value
+        log_prob_arr[step, index] = log_prob
+
+        observation, reward, terminated, truncated, info = env.step(action)
+        if truncated and not terminated:
+            _, terminal_value, _ = client.act(observation)
+            reward += gamma * terminal_value
+        episode_start = terminated or truncated
+        if episode_start:
+            if "episode" in info:
+                episode_infos.append(info)
+            observation, _ = env.reset()
+        reward_arr[step, index] = reward
+    return observation, episode_start, episode_infos
+
+
+def _worker(remote, parent_remote, env_fn_wrapper: CloudpickleWrapper, buffers, shapes, index: int,
+            rollout=None) -> None:
+    parent_remote.close()
+    obs_buf, rew_buf, done_buf = (_as_ndarray(raw, shape, dtype) for raw, (shape, dtype) in zip(buffers, shapes))
+    if rollout is not None:
+        client, rollout_buffers, rollout_shapes = rollout
+        rollout_arrays = [_as_ndarray(raw, shape, dtype) for raw, (shape, dtype) in zip(rollout_buffers, rollout_shapes)]
+    env = env_fn_wrapper.var()
+    observation, episode_start = None, True
+    while True:
+        try:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                observation, reward, terminated, truncated, info = env.step(data)
+                done = terminated or truncated
+                info["TimeLimit.truncated"] = truncated and not terminated
+                reset_info = {}
+                if done:
+                    # 终止帧需要单独保存，共享内存里随后写入 reset 之后的观测
+                    info["terminal_observation"] = np.array(observation)
+                    observation, reset_info = env.reset()
+                obs_buf[index] = observation
+                rew_buf[index] = reward
+                done_buf[index] = done
+                episode_start = done
+                remote.send((info, reset_info))
+            elif cmd == "reset":
+                maybe_options = {"options": data[1]} if data[1] else {}
+                observation, reset_info = env.reset(seed=data[0], **maybe_options)
+                obs_buf[index] = observation
+                episode_start = True
+                remote.send(reset_info)
+            elif cmd == "rollout":
+                observation, episode_start, episode_infos = _collect(
+                    env, client, rollout_arrays, index, observation, episode_start, *data
+                )
+                obs_buf[index] = observation
+                done_buf[index] = episode_start
+                remote.send(episode_infos)
+            elif cmd == "render":
+                remote.send(env.render())
+            elif cmd == "close":
+                env.close()
+                remote.close()
+                break
+            elif cmd == "env_method":
+                method = env.get_wrapper_attr(data[0])
+                remote.send(method(*data[1], **data[2]))
+            elif cmd == "get_attr":
+                remote.send(env.get_wrapper_attr(data))
+            elif cmd == "has_attr":
+                try:
+                    env.get_wrapper_attr(data)
+                    remote.send(True)
+                except AttributeError:
+                    remote.send(False)
+            elif cmd == "set_attr":
+                # 与 get_attr / env_method 一样按 wrapper 链解析（例如 MultiTaskEnv.render_screen 的 setter）
+                remote.send(env.set_wrapper_attr(data[0], data[1]))
+            elif cmd == "is_wrapped":
+                from stable_baselines3.common.env_util import is_wrapped
+
+                remote.send(is_wrapped(env, data))
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+        except (EOFError, KeyboardInterrupt):
+            break
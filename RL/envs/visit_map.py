@@ -0,0 +1,133 @@
+from __future__ import annotations
+import os
+from multiprocessing import shared_memory
+from typing import List
+
+import numpy as np
+
+# 格子访问记录：按 (房间, tile_y, tile_x) 平铺成一维下标，每步的判定只做整数运算，不构造元组 / 集合。
+# Link 的坐标来自 OAM（0~255 像素），8 像素一格，所以每个房间 32x32 格就够了。
+ROOMS = 256
+TILES = 32
+
+
+def tile_index(room: int, tile_x: int, tile_y: int) -> int:
+    return (room << 10) | (tile_y << 5) | tile_x
+
+
+class TileBitmap:
+    """
+    回合内的格子访问位图（代替 set[(room, x, y)]）：每个格子 1 bit，共 32 KB，
+    add 只有几次位运算，clear 是一次 memset。
+    """
+    __slots__ = ("bits",)
+
+    def __init__(self):
+        self.bits = bytearray(ROOMS * TILES * TILES // 8)
+
+    def add(self, room: int, tile_x: int, tile_y: int) -> bool:
+        """标记格子，返回它在本回合里是否第一次被访问"""
+        # 每行 32 格正好 4 个字节：字节下标 = (room, tile_y, tile_x // 8)
+        position = (room << 7) | (tile_y << 2) | (tile_x >> 3)
+        bit = 1 << (tile_x & 7)
+        bits = self.bits
+        byte = bits[position]
+        if byte & bit:
+            return False
+        bits[position] = byte | bit
+        return True
+
+    def __contains__(self, key) -> bool:
+        index = tile_index(*key)
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def __len__(self) -> int:
+        return int(np.unpackbits(np.frombuffer(self.bits, dtype=np.uint8)).sum())
+
+    def __getstate__(self):
+        return bytes(self.bits)
+
+    def __setstate__(self, state):
+        self.bits = bytearray(state)
+
+    def clear(self):
+        np.frombuffer(self.bits, dtype=np.uint8)[:] = 0
+
+
+class VisitCounts:
+    """
+    整个训练过程的 (房间, 格子) 访问计数，放在共享内存里，所有 worker 共用一份。
+    在主进程里创建后作为环境参数传给 worker（pickle 时只传共享内存的名字），每步 +1。
+    计数的读-改-写不加锁，多个 worker 同时踩到同一格时偶尔会少计一次，对探索奖励没有影响。
+
+    :param name: 已有共享内存的名字；为 None 时新建（由创建者负责 close 时释放）
+    """
+    def __init__(self, name: str | None = None):
+        self.owner = name is None
+        self._shm = shared_memory.SharedMemory(name=name, create=self.owner, size=ROOMS * TILES * TILES * 4)
+        self._flat = self._shm.buf.cast("I")
+        self.counts = np.ndarray((ROOMS, TILES, TILES), dtype=np.uint32, buffer=self._shm.buf)
+
+    def __getstate__(self):
+        return {"name": self._shm.name}
+
+    def __setstate__(self, state):
+        self.__init__(state["name"])
+
+    def add(self, room: int, tile_x: int, tile_y: int) -> int:
+        """访问计数 +1，返回加上本次之后的总次数"""
+        flat = self._flat
+        index = (room << 10) | (tile_y << 5) | tile_x
+        count = flat[index] + 1
+        flat[index] = count
+        return count
+
+    def get(self, room: int, tile_x: int, tile_y: int) -> int:
+        return self._flat[tile_index(room, tile_x, tile_y)]
+
+    def rooms(self) -> List[int]:
+        """到过的房间"""
+        return [int(room) for room in np.flatnonzero(self.counts.reshape(ROOMS, -1).any(axis=1))]
+
+    def heatmap(self, room: int) -> np.ndarray:
+        """房间的 (TILES, TILES) 访问计数，行为 tile_y，列为 tile_x"""
+        return self.counts[room].copy()
+
+    def save(self, path: str):
+        """保存全部计数（npz，只存到过的房间）"""
+        rooms = self.rooms()
+        np.savez_compressed(path, rooms=np.array(rooms, dtype=np.int64), counts=self.counts[rooms])
+
+    def load(self, path: str):
+        """把 save 保存的计数读回来（续训时接着累计）"""
+        with np.load(path) as data:
+            self.counts[data["rooms"]] = data["counts"]
+
+    def save_heatmaps(self, save_dir: str, scale: int = 8):
+        """每个到过的房间输出一张 PNG 热力图（对数刻度，越亮访问越多）"""
+        import imageio
+
+        os.makedirs(save_dir, exist_ok=True)
+        for room in self.rooms():
+            values = np.log1p(self.counts[room].astype(np.float64))
+            image = (values / values.max() * 255).astype(np.uint8)
+            image = np.kron(image, np.ones((scale, scale), dtype=np.uint8))
+            imageio.imwrite(os.path.join(save_dir, f"room_{room}.png"), image)
+
+    def _release_views(self):
+        # 还有 numpy / memoryview 视图时 SharedMemory 不能关闭
+        self.counts = None
+        flat = getattr(self, "_flat", None)
+        if flat is not None:
+            flat.release()
+
+    def close(self):
+        self._release_views()
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+    def __del__(self):
+        # 没有 close 就被回收时（例如 worker 里的副本）先释放视图，否则 SharedMemory.__del__ 会报 BufferError
+        self._release_views()
+
@@ -0,0 +1,34 @@
+import argparse
+
+from envs.replay import Replay
+
+# 用法：
+#   python RL/replay.py record/PPO/ppo58_task2_gifs/step_100000.npz --gif out.gif
+#   python RL/replay.py episode_000001.npz --obs obs.npy --start 100 --stop 300
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-simulate a recorded replay headless")
+    parser.add_argument("replay", help="replay file (.npz)")
+    parser.add_argument("--start", type=int, default=0, help="first step to export")
+    parser.add_argument("--stop", type=int, default=None, help="last step to export")
+    parser.add_argument("--gif", help="write the selected steps as a GIF")
+    parser.add_argument("--obs", help="write the selected observations as a .npy array")
+    parser.add_argument("--fps", type=int, default=30)
+    args = parser.parse_args()
+
+    replay = Replay.load(args.replay)
+    start = replay.meta['save_file']
+    if replay.state is not None:
+        start = f"archived cell {replay.meta.get('start_cell')} (embedded state)"
+    print(f"{args.replay}: {len(replay)} steps from {start} ({replay.meta['env_class']})")
+    if args.gif:
+        replay.to_gif(args.gif, start=args.start, stop=args.stop, fps=args.fps)
+        print(f"Saved GIF to {args.gif}")
+    if args.obs:
+        import numpy as np
+        np.save(args.obs, replay.observations(start=args.start, stop=args.stop))
+        print(f"Saved observations to {args.obs}")
+
+
+if __name__ == "__main__":
+    main()
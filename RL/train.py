@@ -1,20 +1,42 @@
 import gymnasium as gym
 from stable_baselines3 import PPO
 from stable_baselines3.common.callbacks import CheckpointCallback, BaseCallback
-from stable_baselines3.common.monitor import Monitor
 import torch.nn as nn
 import torch
 import numpy as np
-import imageio
+import argparse
 import os
 
-from envs.base_env import BaseEnv
+from envs.base_env import BaseEnv, preload_states
+from envs.env51_01 import Room51_Task1_Env
+from envs.env58_01 import Room58_Task1_Env
 from envs.env58_02 import Room58_Task2_Env as Zelda_Env
+from envs.multi_task import MultiTaskEnv, Task, success_weights
+from envs.fork_server import EmulatorForkServer
+from envs.visit_map import VisitCounts
+from envs.vec_env import SharedMemVecEnv, make_env
 from PPO.model import CustomResNet, CustomACPolicy, CustomPPO, TQDMProgressBar
+from PPO.callbacks import AsyncSaveGifCallback, AsyncCheckpointCallback, StepTimingCallback, TaskStatsCallback
+from PPO.checkpoint import latest_checkpoint, load_checkpoint
+from PPO.pretrain import behavior_cloning
 
 TOTAL_STEPS = 3000000
 SAVE_INTERVAL = 100000
+N_ENVS = 8
+N_STEPS = 4096 // N_ENVS  # 保持每次更新的样本总数不变
+PROFILE = False           # 开启后把 BaseEnv.step 各阶段耗时写入 TensorBoard（timing/）
+INFERENCE_SERVER = False  # True 时由单独的推理进程批量计算动作，worker 自行采样（见 envs/inference_server.py）
+FRAME_STACK = 1           # >1 时观测为最近 k 帧 (k, 8, 10)，让策略能看到运动
+ARCHIVE_SIZE = 0          # >0 时开启探索档案：每个 worker 最多保存的格子存档数（见 envs/explore_archive.py）
+VISIT_COUNTS = True       # 所有 worker 共享的格子访问计数（见 envs/visit_map.py），训练结束时输出热力图
+VISIT_PATH = "record/PPO/ppo58_task2_visits/"
+FORK_SERVER = False       # True 时 worker 从预启动模拟器的模板进程 fork 出来（见 envs/fork_server.py，不能与 INFERENCE_SERVER 同时开启）
+CAPTURE_DIR = None        # 设为目录时把每一步写进离线数据集（见 envs/rollout_dataset.py），每个 worker 一个子目录
+BC_DATASET = None         # 设为数据集目录时先用行为克隆预训练策略（见 PPO/pretrain.py）
+BC_EPOCHS = 1
 GIF_SAVE_PATH = "record/PPO/ppo58_task2_gifs/"
+CHECKPOINT_PATH = "RL/RL_model/checkpoints/ppo58_task2/"  # 完整训练检查点（可用 --resume 续训）
+CHECKPOINT_INTERVAL = 100000
 
 save_state = "game_state/Room58_task2.state"
 game_file = "game_state/Link's awakening.gb"
@@ -22,101 +44,114 @@ game_file = "game_state/Link's awakening.gb"
 env_kwargs = {
     "game_file": game_file,
     "save_file": save_state, 
+    "frame_stack": FRAME_STACK,
 }
-os.makedirs(GIF_SAVE_PATH, exist_ok=True)
-
-env = Zelda_Env(game_file=game_file, save_file=save_state)
-env.disable_render = True
-env = Monitor(env)
-
-class SaveGifCallback(BaseCallback):
-    def __init__(self, env_class, env_kwargs, save_path, save_interval, max_frames=1000, verbose=0):
-        """
-        :param env_class: 环境的类对象 (例如 Zelda_Env)
-        :param env_kwargs: 初始化环境需要的参数字典
-        :param save_path: GIF 保存路径
-        :param save_interval: 保存间隔
-        :param max_frames: 限制录制的最大帧数，防止无限循环
-        """
-        super(SaveGifCallback, self).__init__(verbose)
-        self.env_class = env_class
-        self.env_kwargs = env_kwargs
-        self.save_path = save_path
-        self.save_interval = save_interval
-        self.max_frames = max_frames
-        os.makedirs(self.save_path, exist_ok=True)
-
-    def _on_step(self) -> bool:
-        if self.num_timesteps % self.save_interval == 0:
-            gif_filename = f"step_{self.num_timesteps}.gif"
-            gif_path = os.path.join(self.save_path, gif_filename)
-            self._save_gif(gif_path)
-        return True
-    
-    def _save_gif(self, gif_path):
-        if self.verbose > 0:
-            print(f"Creating evaluation env and recording GIF to {gif_path}...")
-        eval_env = self.env_class(**self.env_kwargs)
-        frames = []
-        try:
-            obs, _ = eval_env.reset()
-            for _ in range(self.max_frames):
-                # 获取图像
-                frame_np = np.array(eval_env.pyboy.screen.image)
-                if frame_np is not None:
-                    frames.append(frame_np)
-
-                action, _ = self.model.predict(obs, deterministic=True)
-                obs, _, done, truncated, _ = eval_env.step(action)
-                if done or truncated:
-                    break
-        except Exception as e:
-            print(f"Error during GIF recording: {e}")
-        finally:
-            eval_env.close()
-
-        if len(frames) > 0:
-            imageio.mimsave(gif_path, frames, fps=30)
-            if self.verbose > 0:
-                print(f"Saved GIF with {len(frames)} frames.")
-        else:
-            print("Warning: No frames were captured.")
-
-policy_kwargs = {
-    "features_extractor_class": CustomResNet,
-    "features_extractor_kwargs": {"features_dim": 1024},
-    "activation_fn": nn.ReLU,
-    "net_arch": [],
-    "optimizer_class": torch.optim.Adam,
-    "optimizer_kwargs": {"eps": 1e-5}
-}
 
-model = CustomPPO(
-    CustomACPolicy,
-    env,
-    policy_kwargs=policy_kwargs,
-    learning_rate=3e-4,
-    n_steps=4096,
-    batch_size=512,
-    n_epochs=3,
-    gamma=0.95,
-    gae_lambda=0.65,
-    clip_range=0.2,
-    ent_coef=0.01,
-    vf_coef=0.5,
-    max_grad_norm=0.5,
-    verbose=1,
-    normalize_advantage=False,
-    tensorboard_log="./log/Room58/ppo_tensorboard/"
-)
-
-gif_callback = SaveGifCallback(
-    env_class=Zelda_Env,
-    env_kwargs=env_kwargs,
-    save_path=GIF_SAVE_PATH,
-    save_interval=SAVE_INTERVAL
-)
-
-model.learn(total_timesteps=TOTAL_STEPS, progress_bar=True, callback=gif_callback)
-model.save("RL/RL_model/test/ppo58_task2_final")
-env.close()
\ No newline at end of file
+# 多任务训练：MULTI_TASK=True 时每个 worker 按权重混合运行下面的任务，共用一个模型
+# 各任务的统计写入 TensorBoard 的 tasks/ 分组，REWEIGHT=True 时按完成率调整权重（完成率低的多练）
+MULTI_TASK = False
+REWEIGHT = False
+TASKS = [
+    Task("room51_task1", Room51_Task1_Env, "game_state/Room51_task1.state"),
+    Task("room58_task1", Room58_Task1_Env, "game_state/Room58_task1.state"),
+    Task("room58_task2", Zelda_Env, "game_state/Room58_task2.state"),
+]
+
+
+def main(resume: str | None = None):
+    os.makedirs(GIF_SAVE_PATH, exist_ok=True)
+    if MULTI_TASK:
+        env_class = MultiTaskEnv
+        kwargs = {"tasks": TASKS, "game_file": game_file, "frame_stack": FRAME_STACK}
+        preload_states(*[task.save_file for task in TASKS])
+    else:
+        env_class, kwargs = Zelda_Env, env_kwargs
+        preload_states(save_state)  # fork 出来的 worker 共享同一份存档缓存
+    visit_counts = VisitCounts() if VISIT_COUNTS else None
+    save_files = [task.save_file for task in TASKS] if MULTI_TASK else [save_state]
+    fork_server = EmulatorForkServer(game_file, save_files, preload=[env_class.__module__]) if FORK_SERVER else None
+    env = SharedMemVecEnv([
+        make_env(env_class, rank=i, profile=PROFILE, archive_size=ARCHIVE_SIZE, visit_counts=visit_counts,
+                 capture_dir=CAPTURE_DIR, **kwargs)
+        for i in range(N_ENVS)
+    ], rollout_steps=N_STEPS if INFERENCE_SERVER else 0, fork_server=fork_server)
+
+    policy_kwargs = {
+        "features_extractor_class": CustomResNet,
+        "features_extractor_kwargs": {"features_dim": 1024},
+        "activation_fn": nn.ReLU,
+        "net_arch": [],
+        "optimizer_class": torch.optim.Adam,
+        "optimizer_kwargs": {"eps": 1e-5},
+        # 叠帧后的 (k, 8, 10) uint8 观测会被 SB3 当作图像除以 255，这里关掉，和单帧时输入尺度一致
+        "normalize_images": False,
+    }
+
+    model = CustomPPO(
+        CustomACPolicy,
+        env,
+        policy_kwargs=policy_kwargs,
+        learning_rate=3e-4,
+        n_steps=N_STEPS,
+        batch_size=512,
+        n_epochs=3,
+        gamma=0.95,
+        gae_lambda=0.65,
+        clip_range=0.2,
+        ent_coef=0.01,
+        vf_coef=0.5,
+        max_grad_norm=0.5,
+        verbose=1,
+        normalize_advantage=False,
+        tensorboard_log="./log/Room58/ppo_tensorboard/"
+    )
+
+    # 行为克隆预训练（续训时跳过，检查点里已经是训练过的权重）
+    if BC_DATASET is not None and resume is None:
+        from envs.rollout_dataset import RolloutDataset
+
+        dataset = RolloutDataset(BC_DATASET)
+        losses = behavior_cloning(model.policy, dataset, epochs=BC_EPOCHS)
+        print(f"Behavior cloning on {len(dataset)} steps, loss per epoch: {losses}")
+
+    # 续训：恢复策略、优化器、EWMA 统计、计数器和各环境进行中的回合
+    if resume is not None:
+        checkpoint = latest_checkpoint(resume)
+        if checkpoint is None:
+            raise FileNotFoundError(f"No checkpoint found in {resume}")
+        load_checkpoint(model, checkpoint, visit_counts=visit_counts)
+        print(f"Resumed from {checkpoint} at step {model.num_timesteps}")
+
+    # 录制在后台进程里进行，不阻塞 model.learn
+    gif_callback = AsyncSaveGifCallback(
+        env_class=env_class,
+        env_kwargs=kwargs,
+        save_path=GIF_SAVE_PATH,
+        save_interval=SAVE_INTERVAL
+    )
+
+    checkpoint_callback = AsyncCheckpointCallback(save_path=CHECKPOINT_PATH, save_interval=CHECKPOINT_INTERVAL,
+                                                  visit_counts=visit_counts)
+    callbacks = [gif_callback, checkpoint_callback]
+    if PROFILE:
+        callbacks.append(StepTimingCallback())
+    if MULTI_TASK:
+        callbacks.append(TaskStatsCallback(reweight=(lambda stats, _: success_weights(stats)) if REWEIGHT else None))
+
+    model.learn(total_timesteps=TOTAL_STEPS - model.num_timesteps, progress_bar=True, callback=callbacks,
+                reset_num_timesteps=resume is None)
+    model.save("RL/RL_model/test/ppo58_task2_final")
+    env.close()
+    if visit_counts is not None:
+        visit_counts.save_heatmaps(VISIT_PATH)
+        visit_counts.save(os.path.join(VISIT_PATH, "visit_counts.npz"))
+        visit_counts.close()
+    if fork_server is not None:
+        fork_server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", nargs="?", const=CHECKPOINT_PATH, default=None,
+                        help="从检查点继续训练：检查点文件或目录（默认 CHECKPOINT_PATH 里最新的一个）")
+    main(parser.parse_args().resume)
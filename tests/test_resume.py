@@ -0,0 +1,51 @@
+import os
+import sys
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "RL"))
+
+from envs.vec_worker import make_env
+from envs.env58_02 import Room58_Task2_Env
+
+GAME_FILE = os.path.join(ROOT, "game_state", "Link's awakening.gb")
+SAVE_FILE = os.path.join(ROOT, "game_state", "Room58_task2.state")
+MAX_ACTIONS = 3000
+
+
+def _make():
+    return make_env(Room58_Task2_Env, rank=0, seed=0, game_file=GAME_FILE, save_file=SAVE_FILE)()
+
+
+def _run_until_episode(env, actions):
+    for action in actions:
+        _, _, terminated, truncated, info = env.step(int(action))
+        if terminated or truncated:
+            return info["episode"]
+    raise AssertionError("episode did not finish")
+
+
+def test_resumed_episode_stats_match_uninterrupted_run():
+    actions = np.random.default_rng(0).integers(0, 6, MAX_ACTIONS)
+
+    env = _make()
+    expected = _run_until_episode(env, actions)
+    env.close()
+    split = expected["l"] // 2
+    assert split > 0
+
+    # 回合进行到一半时截取快照（与训练检查点里 env_method("snapshot") 相同），在新的 worker 环境里恢复
+    env = _make()
+    for action in actions[:split]:
+        env.step(int(action))
+    snapshot = env.get_wrapper_attr("snapshot")()
+    env.close()
+
+    resumed = _make()
+    resumed.reset(options={"snapshot": snapshot})
+    episode = _run_until_episode(resumed, actions[split:])
+    resumed.close()
+
+    assert episode["l"] == expected["l"]
+    assert episode["r"] == expected["r"]
@@ -1,8 +1,13 @@
-import numpy as np
+import os
+import sys
 from pyboy import PyBoy
 from pynput import keyboard
 import time
 
+# 实体表的地址和解码与环境共用 RL/envs/entities.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RL"))
+from envs.entities import EntityTable, ENTITY_TURTLE
+
 pyboy = PyBoy("game_state/Link's awakening.gb")
 load_state = "game_state/Room58_task2.state"
 
@@ -32,14 +37,12 @@ def on_release(key):
 listener = keyboard.Listener(on_press=on_press, on_release=on_release)
 listener.start()
 
+entity_table = EntityTable()
+
 def _get_monsters(pyboy):
-    game_area = pyboy.game_area()
-    sub_area = game_area[:20, :20]
-    thresholds = [85, 170]
-    labels = np.digitize(sub_area, thresholds)
-    count_0 = np.count_nonzero(labels == 0)
-    turtles = (count_0 - 1) // 4
-    return turtles
+    # 按字段读取实体表，统计存活的乌龟数量
+    entity_table.update(pyboy)
+    return entity_table.count(ENTITY_TURTLE)
 
 try:
     for i in range(100000):
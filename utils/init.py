@@ -1 +1 @@
-from .screen_abstract import gamearea_abstract
+from .screen_abstract import gamearea_abstract, gamearea_abstract_batch
@@ -1,64 +1,23 @@
 import os
-import imageio
 import numpy as np
+from PIL import Image, GifImagePlugin
 from pyboy import PyBoy
-from pynput import keyboard
-from stable_baselines3.common.callbacks import BaseCallback
 
 RECORD_FPS = 30          # 保存 GIF 时使用的 fps
-MAX_FRAMES = 3000        # 防止无限增长
 OUTPUT_GIF = "record/human_play/test.gif"
 
+# Game Boy 的四阶灰度（PyBoy 默认调色板），作为 GIF 的全局调色板
+GB_PALETTE = np.array([
+    [0xFF, 0xFF, 0xFF],
+    [0x99, 0x99, 0x99],
+    [0x55, 0x55, 0x55],
+    [0x00, 0x00, 0x00],
+], dtype=np.uint8)
+
 recording = True         # 初始即录制
 running = True
-frames = []
 frame_count = 0
 
-class SaveGifCallback(BaseCallback):
-    def __init__(self, env_class, env_kwargs, save_path, save_interval, max_frames=1000, verbose=0):
-        super(SaveGifCallback, self).__init__(verbose)
-        self.env_class = env_class
-        self.env_kwargs = env_kwargs
-        self.save_path = save_path
-        self.save_interval = save_interval
-        self.max_frames = max_frames
-        os.makedirs(self.save_path, exist_ok=True)
-
-    def _on_step(self) -> bool:
-        if self.num_timesteps % self.save_interval == 0:
-            gif_filename = f"step_{self.num_timesteps}.gif"
-            gif_path = os.path.join(self.save_path, gif_filename)
-            self._save_gif(gif_path)
-        return True
-    
-    def _save_gif(self, gif_path):
-        if self.verbose:
-            print(f"Creating evaluation env and recording GIF to {gif_path}...")
-        eval_env = self.env_class(**self.env_kwargs)
-
-        frames = []
-        try:
-            obs, _ = eval_env.reset()
-            for _ in range(self.max_frames):
-                frame = eval_env.render(mode="rgb_array")
-                if frame is not None:
-                    frames.append(frame)
-                action, _ = self.model.predict(obs, deterministic=True)
-                obs, _, done, truncated, _ = eval_env.step(action)
-                if done or truncated:
-                    break
-        except Exception as e:
-            print(f"Error during GIF recording: {e}")
-        finally:
-            eval_env.close()
-
-        if frames:
-            imageio.mimsave(gif_path, frames, fps=30)
-            if self.verbose:
-                print(f"Saved GIF with {len(frames)} frames.")
-        else:
-            print("Warning: No frames were captured.")
-
 def on_press(key):
     global last_save_state, running
     try:
@@ -71,15 +30,89 @@ def on_press(key):
     except Exception as e:
         print("键盘处理错误:", e)
 
-def save_gif(path, frames_list):
-    if not frames_list:
-        print("No frames to save.")
-        return
-    print(f"Saving GIF to {path} with {len(frames_list)} frames...")
-    imageio.mimsave(path, frames_list, fps=RECORD_FPS)
+class StreamingGifWriter:
+    """
+    边录边写的 GIF 编码器：内存占用恒定，录制长度不受限制。
+    画面是灰度的，直接用查表把像素映射成四阶调色板索引（不做颜色量化）；
+    连续相同的帧合并成一帧，只延长显示时间。
+    """
+    def __init__(self, path, fps=RECORD_FPS, palette=GB_PALETTE):
+        self.path = path
+        self.fps = fps
+        self.palette = palette
+        # 按 R 通道查表到最近的灰阶索引
+        levels = palette[:, 0].astype(np.int16)
+        self.lut = np.abs(np.arange(256, dtype=np.int16)[:, None] - levels[None, :]).argmin(axis=1).astype(np.uint8)
+        self.frames_in = 0       # 收到的帧数
+        self.frames_out = 0      # 实际写入的帧数（合并后）
+        self._written_in = 0     # 已写入部分对应的输入帧数
+        self._elapsed_cs = 0     # 已写入的总时长（1/100 秒）
+        self._pending = None
+        self._pending_count = 0
+        self._fp = None
+        self._image = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, frame: np.ndarray):
+        """frame: (H, W, 3/4) 的 RGB(A) 画面，例如 pyboy.screen.ndarray"""
+        indices = self.lut[frame[..., 0]]
+        self.frames_in += 1
+        if self._pending is not None and np.array_equal(indices, self._pending):
+            self._pending_count += 1
+            return
+        self._flush()
+        self._pending = indices
+        self._pending_count = 1
+
+    def _open(self, height, width):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._fp = open(self.path, "wb")
+        self._image = Image.new("P", (width, height))
+        self._image.putpalette(self.palette.tobytes())
+        # 文件头 + 全局调色板（4 色，表大小字段为 1 -> 2^(1+1)）+ 无限循环
+        self._fp.write(b"GIF89a")
+        self._fp.write(width.to_bytes(2, "little") + height.to_bytes(2, "little"))
+        self._fp.write(bytes([0x80 | 0x70 | 0x01, 0, 0]))
+        self._fp.write(self.palette.tobytes())
+        self._fp.write(b"!\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00")
+
+    def _flush(self):
+        if self._pending is None:
+            return
+        if self._fp is None:
+            self._open(*self._pending.shape)
+        # 按累计时间取整，避免逐帧四舍五入带来的漂移；GIF 延时小于 2 会被播放器当成 10
+        self._written_in += self._pending_count
+        delay = max(round(self._written_in * 100 / self.fps) - self._elapsed_cs, 2)
+        self._elapsed_cs += delay
+        self._image.frombytes(self._pending.tobytes())
+        while delay > 0:
+            chunk = min(delay, 0xFFFF)
+            delay -= chunk
+            # 图形控制扩展：只设置延时
+            self._fp.write(b"!\xf9\x04\x00" + chunk.to_bytes(2, "little") + b"\x00\x00")
+            for data in GifImagePlugin.getdata(self._image):
+                self._fp.write(data)
+            self.frames_out += 1
+        self._pending = None
+
+    def close(self):
+        if self._pending is not None:
+            self._flush()
+        if self._fp is not None:
+            self._fp.write(b";")
+            self._fp.close()
+            self._fp = None
 
 def main():
     global frame_count
+    from pynput import keyboard  # 只有手动录制时需要
+
     pyboy = PyBoy("game_state/Link's awakening.gb", window="null", sound_emulated=False)
     state_path = "game_state/Room58_task2.state"
     try:
@@ -91,20 +124,18 @@ def main():
     listener = keyboard.Listener(on_press=on_press)
     listener.start()
 
-    while running and pyboy.tick():
-        if recording:
-            frame_np = np.array(pyboy.screen.image)
-            frames.append(frame_np)
-            frame_count += 1
-            if frame_count % 120 == 0:
-                print(f"Recorded {frame_count} frames...")
-            if frame_count >= MAX_FRAMES:
-                print("Reached maximum frame count, stopping automatically.")
-                break
+    # 帧到达即编码写盘，不再在内存里累积整段录像
+    with StreamingGifWriter(OUTPUT_GIF, fps=RECORD_FPS) as writer:
+        while running and pyboy.tick():
+            if recording:
+                writer.append(pyboy.screen.ndarray)
+                frame_count += 1
+                if frame_count % 120 == 0:
+                    print(f"Recorded {frame_count} frames...")
 
     listener.stop()
     pyboy.stop()
-    save_gif(OUTPUT_GIF, frames)
+    print(f"Saved {OUTPUT_GIF}: {writer.frames_in} frames, {writer.frames_out} after merging duplicates")
     print("Finished")
 
 if __name__ == "__main__":
@@ -1,24 +1,8 @@
-import io
 from pyboy import PyBoy
 import numpy as np
-import matplotlib.pyplot as plt
-from pynput import keyboard
-import torch
-import torch.nn as nn
-import torch.nn.functional as F
-from screen_abstract import gamearea_abstract
 import os
 from datetime import datetime
 
-pyboy = PyBoy("game_state/Link's awakening.gb")
-load_state = "game_state/Room58_task2.state"
-
-try:
-    with open(load_state, "rb") as f:
-        pyboy.load_state(f)
-except FileNotFoundError:
-    print("No existing save file, starting new game")
-
 running = True
 latest_frame = None  # 新增: 保存当前帧
 
@@ -27,6 +11,8 @@ def _ensure_dir(path):
         os.makedirs(path)
 
 def _save_frame(array_2d):
+    import matplotlib.pyplot as plt  # 只在保存时导入
+
     _ensure_dir("img/saved_images")
     ts = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
     fname = f"img/saved_images/frame_{ts}.png"
@@ -50,39 +36,49 @@ def on_press(key):
     except Exception as e:
         print("键盘处理错误:", e)
 
-listener = keyboard.Listener(on_press=on_press)
-listener.start()
+def _get_obs(pyboy):
+    screen = pyboy.screen.ndarray[:, :, 0]
+    return screen
 
-"""
-plt.ion()
-fig, ax = plt.subplots()
-image_data = np.zeros((8, 10))
-img = ax.imshow(image_data, cmap='gray', vmin=0, vmax=255)
+def main():
+    global latest_frame
+    from pynput import keyboard
 
-plt.show()
-"""
+    pyboy = PyBoy("game_state/Link's awakening.gb")
+    load_state = "game_state/Room58_task2.state"
 
-"""
-def _get_obs(pyboy):
-    screen_tensor = torch.tensor(pyboy.screen.ndarray[:128, :160, 0], dtype=torch.float32)
-    pooled = gamearea_abstract(screen_tensor)
-    return pooled
-"""
+    try:
+        with open(load_state, "rb") as f:
+            pyboy.load_state(f)
+    except FileNotFoundError:
+        print("No existing save file, starting new game")
 
-def _get_obs(pyboy):
-    screen = pyboy.screen.ndarray[:, :, 0]
-    return screen
+    listener = keyboard.Listener(on_press=on_press)
+    listener.start()
+
+    """
+    plt.ion()
+    fig, ax = plt.subplots()
+    image_data = np.zeros((8, 10))
+    img = ax.imshow(image_data, cmap='gray', vmin=0, vmax=255)
+
+    plt.show()
+    """
+
+    for k in range(100000):
+        if not running:
+            break
+        pyboy.tick()
+        sub_screen = _get_obs(pyboy)
+        latest_frame = sub_screen  # 新增: 记录当前帧
+        #img.set_data(sub_screen)
+
+        #plt.draw()
+        #plt.pause(0.001)
 
-for k in range(100000):
-    if not running:
-        break
-    pyboy.tick()
-    sub_screen = _get_obs(pyboy)
-    latest_frame = sub_screen  # 新增: 记录当前帧
-    #img.set_data(sub_screen)
+    listener.stop()
+    pyboy.stop()
 
-    #plt.draw()
-    #plt.pause(0.001)
 
-listener.stop()
-pyboy.stop()
\ No newline at end of file
+if __name__ == "__main__":
+    main()